@@ -3,7 +3,12 @@ AI Enhancement Service
 Uses OpenAI to analyze taste, generate playlist names, and provide insights
 """
 
+import hashlib
 import os
+import threading
+
+import orjson
+from cachetools import TTLCache
 from openai import OpenAI
 from dotenv import load_dotenv
 
@@ -11,6 +16,28 @@ load_dotenv()
 
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
+# Successful responses by prompt: re-analyzing the same swipes (e.g. repeated
+# "end session" clicks) skips the OpenAI round trip. Failures aren't cached,
+# so the next call retries
+AI_CACHE_TTL = 3600  # seconds
+_response_cache = TTLCache(maxsize=2048, ttl=AI_CACHE_TTL)
+_response_cache_lock = threading.Lock()
+
+
+def _prompt_key(kind, prompt):
+    """Cache key for a prompt sent by the function named kind"""
+    return hashlib.blake2b(f"{kind}\n{prompt}".encode(), digest_size=16).hexdigest()
+
+
+def _get_cached(key):
+    with _response_cache_lock:
+        return _response_cache.get(key)
+
+
+def _set_cached(key, value):
+    with _response_cache_lock:
+        _response_cache[key] = value
+
 
 def analyze_music_taste(liked_songs, disliked_songs):
     """
@@ -43,6 +70,11 @@ Provide a brief, fun analysis (2-3 sentences) of their music taste. Be specific
   "mood": "detected mood (e.g., upbeat, melancholic, adventurous)"
 }}"""
 
+    key = _prompt_key('taste', prompt)
+    cached = _get_cached(key)
+    if cached is not None:
+        return cached
+
     try:
         response = client.chat.completions.create(
             model=os.getenv('LLM_MODEL', 'gpt-4o-mini'),
@@ -55,8 +87,8 @@ Provide a brief, fun analysis (2-3 sentences) of their music taste. Be specific
             max_tokens=200
         )
         
-        import json
-        result = json.loads(response.choices[0].message.content)
+        result = orjson.loads(response.choices[0].message.content)
+        _set_cached(key, result)
         return result
         
     except Exception as e:
@@ -102,6 +134,11 @@ Examples: "Midnight Indie Sessions", "Sunday Morning Chill", "Electric Dance Ene
 
 Just respond with the playlist name, nothing else."""
 
+    key = _prompt_key('playlist_name', prompt)
+    cached = _get_cached(key)
+    if cached is not None:
+        return cached
+
     try:
         response = client.chat.completions.create(
             model=os.getenv('LLM_MODEL', 'gpt-4o-mini'),
@@ -114,6 +151,7 @@ Just respond with the playlist name, nothing else."""
         )
         
         name = response.choices[0].message.content.strip().strip('"')
+        _set_cached(key, name)
         return name
         
     except Exception as e:
@@ -1,21 +1,29 @@
 import os
 import logging
+import shutil
 import sys
+import tempfile
+import threading
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from uuid import uuid4
+import hashlib
 import time
+from collections import deque
+from operator import itemgetter
 import orjson
-from flask import Flask, jsonify, request, Response, stream_with_context
+from cachetools import TTLCache
+from flask import Flask, request, Response
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
-from parser import parse_spotify_json, parse_spotify_zip, ParseError
+from parser import parse_spotify_json_stream, parse_spotify_zip_stream, ParseError
 from segmentation import segment_listening_history, calculate_aggregate_stats
 from llm_service import name_all_eras
-from playlist_builder import build_all_playlists
-from models import Era, Playlist
+from playlist_builder import build_playlist
+from models import Era, Playlist, Session
 from typing import Optional, Tuple
 
 load_dotenv()
@@ -37,7 +45,33 @@ IS_DEVELOPMENT = os.getenv('FLASK_ENV') == 'development'
 
 # Serve frontend static files
 app = Flask(__name__, static_folder='../frontend', static_url_path='')
-app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB
+app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB sanity cap; bodies are spooled, not buffered
+
+# orjson serializes date/datetime natively, so payloads need no isoformat() pass
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC
+
+
+class ORJSONProvider(JSONProvider):
+    """Route jsonify(), request.get_json() and friends through orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=ORJSON_OPTIONS), mimetype='application/json')
+
+
+app.json = ORJSONProvider(app)
+
+
+def ojsonify(obj, status=200):
+    """Build a JSON response with orjson instead of Flask's stdlib encoder."""
+    return Response(orjson.dumps(obj, option=ORJSON_OPTIONS), status=status, mimetype='application/json')
+
 
 @app.route('/')
 def index():
@@ -86,8 +120,22 @@ limiter = Limiter(
     storage_uri="memory://"
 )
 
-# In-memory session store
-sessions = {}
+# Session store settings
+SESSION_MAX_AGE = 3600  # seconds of idle time
+SESSION_MAX_COUNT = 10_000
+
+# In-memory session store. TTLCache keeps entries in expiry order, so expiring
+# idle sessions only visits the expired ones; re-setting a key restarts its TTL.
+# All access goes through sessions_lock since request threads share it.
+sessions = TTLCache(maxsize=SESSION_MAX_COUNT, ttl=SESSION_MAX_AGE, timer=time.monotonic)
+sessions_lock = threading.RLock()
+
+# Constant (payload, status) returned for unknown or expired session ids
+SESSION_NOT_FOUND = ({"error": "Session not found"}, 404)
+
+# Expired sessions are recycled here instead of being reallocated per upload
+SESSION_POOL_SIZE = 256
+session_pool = deque(maxlen=SESSION_POOL_SIZE)
 
 # Security headers middleware
 @app.after_request
@@ -113,22 +161,19 @@ def set_security_headers(response):
 def not_found(error):
     """Handle 404 errors"""
     logger.warning(f"404 error: {request.url}")
-    return jsonify({'error': 'Resource not found'}), 404
+    return ojsonify({'error': 'Resource not found'}, 404)
 
 @app.errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
     logger.error(f"500 error: {str(error)}", exc_info=True)
-    return jsonify({'error': 'Internal server error'}), 500
+    return ojsonify({'error': 'Internal server error'}, 500)
 
 @app.errorhandler(Exception)
 def handle_exception(error):
     """Handle all other exceptions"""
     logger.error(f"Unhandled exception: {str(error)}", exc_info=True)
-    return jsonify({'error': 'An unexpected error occurred'}), 500
-
-# Session cleanup settings
-SESSION_MAX_AGE = timedelta(hours=1)
+    return ojsonify({'error': 'An unexpected error occurred'}, 500)
 
 
 # ===========================================================================
@@ -138,11 +183,11 @@ SESSION_MAX_AGE = timedelta(hours=1)
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint for load balancers and monitoring"""
-    return jsonify({
+    return ojsonify({
         'status': 'healthy',
         'timestamp': datetime.utcnow().isoformat(),
         'version': '1.0.0'
-    }), 200
+    }, 200)
 
 
 @app.route('/ready', methods=['GET'])
@@ -156,23 +201,23 @@ def readiness_check():
         }
         
         if all(checks.values()):
-            return jsonify({
+            return ojsonify({
                 'status': 'ready',
                 'checks': checks,
                 'timestamp': datetime.utcnow().isoformat()
-            }), 200
+            }, 200)
         else:
-            return jsonify({
+            return ojsonify({
                 'status': 'not_ready',
                 'checks': checks,
                 'timestamp': datetime.utcnow().isoformat()
-            }), 503
+            }, 503)
     except Exception as e:
         logger.error(f"Readiness check failed: {str(e)}")
-        return jsonify({
+        return ojsonify({
             'status': 'error',
             'error': str(e)
-        }), 503
+        }, 503)
 
 
 # ===========================================================================
@@ -181,18 +226,61 @@ def readiness_check():
 
 def cleanup_old_sessions():
     """Remove sessions that have been idle longer than SESSION_MAX_AGE."""
-    now = datetime.now()
-    expired = [
-        sid for sid, data in sessions.items()
-        if (now - data.get('last_accessed', data.get('created_at', now))).total_seconds() > 3600
-    ]
-    for sid in expired:
-        del sessions[sid]
+    with sessions_lock:
+        expired = sessions.expire()
+        for _, session in expired:
+            recycle_session(session)
+
     if expired:
         logger.info(f"Cleaned up {len(expired)} expired sessions")
 
 
-def validate_session_ready(session_id: str) -> Tuple[Optional[dict], Optional[Tuple[dict, int]]]:
+def get_session(session_id: str) -> Optional[Session]:
+    with sessions_lock:
+        return sessions.get(session_id)
+
+
+def touch_session(session_id: str, session: Session) -> bool:
+    """
+    Restart a session's idle TTL.
+
+    Returns False if session_id no longer maps to this session (it expired or
+    was released, and the object may already be recycled), True otherwise.
+    """
+    with sessions_lock:
+        # Expire first so sessions the re-insert would drop are recycled instead
+        cleanup_old_sessions()
+        if sessions.get(session_id) is not session:
+            return False
+        sessions[session_id] = session
+        return True
+
+
+def acquire_session() -> Session:
+    """Take a Session from the pool, or allocate one if the pool is empty."""
+    try:
+        session = session_pool.pop()
+    except IndexError:
+        session = Session(events=None)
+
+    set_progress(session, "uploading", 0)
+    return session
+
+
+def recycle_session(session: Session) -> None:
+    session.reset()
+    session_pool.append(session)
+
+
+def release_session(session_id: str) -> None:
+    """Remove a session from the store and return it to the pool."""
+    with sessions_lock:
+        session = sessions.pop(session_id, None)
+    if session is not None:
+        recycle_session(session)
+
+
+def validate_session_ready(session_id: str) -> Tuple[Optional[Session], Optional[Tuple[dict, int]]]:
     """
     Validate session exists and processing is complete.
 
@@ -200,21 +288,30 @@ def validate_session_ready(session_id: str) -> Tuple[Optional[dict], Optional[Tu
         (session, None) if valid and ready
         (None, (error_dict, status_code)) if invalid
     """
-    if session_id not in sessions:
-        return None, ({"error": "Session not found"}, 404)
+    session = get_session(session_id)
+    if session is None:
+        return None, SESSION_NOT_FOUND
 
-    session = sessions[session_id]
+    # Restart the idle TTL; if the session expired since the lookup, the
+    # object may already belong to the pool or another upload
+    if not touch_session(session_id, session):
+        return None, SESSION_NOT_FOUND
 
-    # Update last accessed time for TTL
-    session["last_accessed"] = datetime.now()
+    return session.ready()
 
-    if session["progress"]["stage"] == "error":
-        return None, ({"error": session["progress"].get("message", "Processing failed")}, 400)
 
-    if session["progress"]["stage"] != "complete":
-        return None, ({"error": "Processing not complete", "stage": session["progress"]["stage"]}, 425)
+def set_progress(session: Session, stage: str, percent: int, message: Optional[str] = None) -> None:
+    """Publish a new progress state and wake any SSE listeners."""
+    session.progress_stage = stage
+    session.progress_message = message
 
-    return session, None
+    data = {"stage": stage, "percent": percent}
+    if message is not None:
+        data["message"] = message
+    # Encoded once here rather than per listener; published last so /progress
+    # never sees a frame that disagrees with its stage
+    session.progress_frame = (stage, sse_frame(data))
+    session.progress_event.set()
 
 
 def serialize_era_summary(era: Era) -> dict:
@@ -222,9 +319,9 @@ def serialize_era_summary(era: Era) -> dict:
     return {
         "id": era.id,
         "title": era.title,
-        "start_date": era.start_date.isoformat(),
-        "end_date": era.end_date.isoformat(),
-        "top_artists": [{"name": name, "plays": count} for name, count in era.top_artists[:3]],
+        "start_date": era.start_date,
+        "end_date": era.end_date,
+        "top_artists": era.top_artists_serialized[:3],
         "playlist_track_count": len(era.top_tracks)
     }
 
@@ -235,11 +332,11 @@ def serialize_era_detail(era: Era, playlist: Optional[Playlist]) -> dict:
         "id": era.id,
         "title": era.title,
         "summary": era.summary,
-        "start_date": era.start_date.isoformat(),
-        "end_date": era.end_date.isoformat(),
+        "start_date": era.start_date,
+        "end_date": era.end_date,
         "total_ms_played": era.total_ms_played,
-        "top_artists": [{"name": name, "plays": count} for name, count in era.top_artists],
-        "top_tracks": [{"track": track, "artist": artist, "plays": count} for track, artist, count in era.top_tracks],
+        "top_artists": era.top_artists_serialized,
+        "top_tracks": era.top_tracks_serialized,
         "playlist": {
             "era_id": playlist.era_id,
             "tracks": playlist.tracks
@@ -247,124 +344,241 @@ def serialize_era_detail(era: Era, playlist: Optional[Playlist]) -> dict:
     }
 
 
+def serialize_summary(session: Session) -> dict:
+    stats = session.stats
+    return {
+        "total_eras": len(session.eras_by_id),
+        "date_range": stats["date_range"],
+        "total_listening_time_ms": stats["total_ms"],
+        "total_tracks": stats["total_tracks"],
+        "total_artists": stats["total_artists"]
+    }
+
+
+def payload_etag(payload: bytes) -> str:
+    return hashlib.blake2b(payload, digest_size=12).hexdigest()
+
+
+def cache_era_payloads(session: Session) -> None:
+    """
+    Serialize the summary, era list and per-era detail payloads once.
+
+    Era data is immutable after processing, so GET handlers can return these
+    bytes directly instead of rebuilding and re-encoding the same dicts, and
+    the ETags computed here let clients revalidate without re-downloading.
+    """
+    eras_by_id = session.eras_by_id
+    playlists_by_era = session.playlists_by_era
+    eras_sorted = sorted(eras_by_id.values(), key=lambda e: e.start_date)
+
+    session.summary_bytes = orjson.dumps(serialize_summary(session), option=ORJSON_OPTIONS)
+    session.summary_etag = payload_etag(session.summary_bytes)
+
+    session.eras_summary_bytes = orjson.dumps(
+        [serialize_era_summary(era) for era in eras_sorted],
+        option=ORJSON_OPTIONS
+    )
+    session.eras_summary_etag = payload_etag(session.eras_summary_bytes)
+
+    session.era_detail_bytes = {
+        era_id: orjson.dumps(serialize_era_detail(era, playlists_by_era.get(era_id)), option=ORJSON_OPTIONS)
+        for era_id, era in eras_by_id.items()
+    }
+    session.era_detail_etags = {
+        era_id: payload_etag(payload) for era_id, payload in session.era_detail_bytes.items()
+    }
+
+
+# Session results never change once processed, but stay private to the uploader
+CACHED_PAYLOAD_MAX_AGE = 60  # seconds
+
+
+def cached_json_response(payload: bytes, etag: str) -> Response:
+    """Return a cached payload with its ETag, or 304 if the client has it."""
+    response = Response(payload, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = CACHED_PAYLOAD_MAX_AGE
+    return response.make_conditional(request)
+
+
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({"status": "ok"})
+    return ojsonify({"status": "ok"})
 
 
 # ZIP magic bytes
 ZIP_MAGIC = b'PK\x03\x04'
 
+# Raw uploads are copied to a temp file in chunks of this size
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 64KB
+
 
 def is_zip_file(file_bytes):
     """Check if file is a ZIP by magic bytes."""
     return file_bytes[:4] == ZIP_MAGIC
 
 
-def is_valid_file_type(file_bytes, filename):
+def is_valid_file_type(file_bytes, filename, is_zip=None):
     """Check if file is a valid ZIP or JSON file."""
-    is_zip = is_zip_file(file_bytes)
-    is_json_ext = filename.lower().endswith('.json')
-    is_zip_ext = filename.lower().endswith('.zip')
-    return is_zip or is_json_ext or is_zip_ext
+    if is_zip is None:
+        is_zip = is_zip_file(file_bytes)
+    return is_zip or filename.lower().endswith(('.json', '.zip'))
 
 
 @app.route('/upload', methods=['POST'])
 @limiter.limit("10 per minute")
 def upload():
-    cleanup_old_sessions()
-
     if 'file' not in request.files:
-        return jsonify({"error": "No file provided"}), 400
+        return ojsonify({"error": "No file provided"}, 400)
 
     file = request.files['file']
     if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
+        return ojsonify({"error": "No file selected"}, 400)
+
+    # werkzeug already streamed the part into a spool (a temp file for
+    # anything large), so JSON is parsed from it rather than copied into memory
+    fp = file.stream
+    header = fp.read(len(ZIP_MAGIC))
+    fp.seek(0)
+    is_zip = is_zip_file(header)
+
+    if not is_valid_file_type(header, file.filename, is_zip):
+        return ojsonify({"error": "Invalid file type. Please upload a .json or .zip file"}, 400)
+
+    if not is_zip:
+        return create_upload_session(fp, is_zip)
+
+    # zipfile needs a fully seekable file object, which the spool is not
+    # before Python 3.11 (no seekable()), so ZIPs go through a real temp file
+    with tempfile.TemporaryFile() as zip_fp:
+        shutil.copyfileobj(fp, zip_fp, UPLOAD_CHUNK_SIZE)
+        zip_fp.seek(0)
+        return create_upload_session(zip_fp, is_zip)
+
+
+@app.route('/upload-stream', methods=['POST'])
+@limiter.limit("10 per minute")
+def upload_stream():
+    """
+    Accept a raw (application/octet-stream) upload body.
+
+    The body is copied to a temporary file in fixed-size chunks, so a large
+    ZIP is never materialized in memory and skips multipart parsing entirely.
+    """
+    with tempfile.TemporaryFile() as fp:
+        shutil.copyfileobj(request.stream, fp, UPLOAD_CHUNK_SIZE)
+        if fp.tell() == 0:
+            return ojsonify({"error": "No file provided"}, 400)
+
+        fp.seek(0)
+        return create_upload_session(fp)
+
 
-    file_bytes = file.read()
+def create_upload_session(fp, is_zip: Optional[bool] = None) -> Response:
+    """
+    Parse an uploaded ZIP/JSON file object into a new session.
 
-    if not is_valid_file_type(file_bytes, file.filename):
-        return jsonify({"error": "Invalid file type. Please upload a .json or .zip file"}), 400
+    is_zip may be passed when the caller has already sniffed the magic bytes.
+    """
+    cleanup_old_sessions()
 
     session_id = str(uuid4())
-    sessions[session_id] = {
-        "events": [],
-        "eras": [],
-        "playlists": [],
-        "stats": {},
-        "progress": {"stage": "uploading", "percent": 0},
-        "created_at": datetime.now(),
-        "last_accessed": datetime.now()
-    }
+    session = acquire_session()
+    with sessions_lock:
+        sessions[session_id] = session
 
-    # Parse the file
+    # Parse the file, dispatching on the ZIP magic bytes
     try:
-        if is_zip_file(file_bytes):
-            events = parse_spotify_zip(file_bytes)
+        if is_zip is None:
+            is_zip = is_zip_file(fp.read(len(ZIP_MAGIC)))
+            fp.seek(0)
+        if is_zip:
+            events = parse_spotify_zip_stream(fp)
         else:
-            events = parse_spotify_json(file_bytes)
+            events = parse_spotify_json_stream(fp)
     except ParseError as e:
-        del sessions[session_id]
-        return jsonify({"error": f"Failed to parse file: {e}"}), 400
+        release_session(session_id)
+        return ojsonify({"error": f"Failed to parse file: {e}"}, 400)
+    except Exception:
+        # Never leave a half-created session behind in the store
+        release_session(session_id)
+        logger.exception("Upload parsing failed")
+        return ojsonify({"error": "Failed to process file"}, 500)
 
     if not events:
-        del sessions[session_id]
-        return jsonify({"error": "No listening history found in file"}), 400
+        release_session(session_id)
+        return ojsonify({"error": "No listening history found in file"}, 400)
 
-    sessions[session_id]["events"] = events
-    sessions[session_id]["progress"] = {"stage": "parsed", "percent": 20}
+    session.store_events(events)
+    set_progress(session, "parsed", 20)
 
-    return jsonify({"session_id": session_id})
+    return ojsonify({"session_id": session_id})
 
 
 # SSE settings
-SSE_POLL_INTERVAL = 0.5  # seconds
 SSE_KEEPALIVE_INTERVAL = 15  # seconds
 SSE_TIMEOUT = 300  # 5 minutes max
 
 
+def sse_frame(data: dict) -> bytes:
+    """Encode one SSE data frame; orjson output is already UTF-8 bytes."""
+    return b"data: " + orjson.dumps(data) + b"\n\n"
+
+
+SSE_TIMEOUT_FRAME = sse_frame({'stage': 'error', 'message': 'Timeout'})
+SSE_EXPIRED_FRAME = sse_frame({'stage': 'error', 'message': 'Session expired'})
+SSE_KEEPALIVE_FRAME = b": keepalive\n\n"
+
+
 @app.route('/progress/<session_id>', methods=['GET'])
 def progress(session_id):
-    if session_id not in sessions:
-        return jsonify({"error": "Session not found"}), 404
+    session = get_session(session_id)
+    if session is None:
+        return ojsonify(*SESSION_NOT_FOUND)
+
+    progress_event = session.progress_event
 
     def generate():
         start_time = time.time()
-        last_keepalive = start_time
+        last_sent = None
 
         while True:
             # Check timeout
             elapsed = time.time() - start_time
             if elapsed > SSE_TIMEOUT:
-                yield f"data: {orjson.dumps({'stage': 'error', 'message': 'Timeout'}).decode()}\n\n"
+                yield SSE_TIMEOUT_FRAME
                 break
 
             # Check if session still exists
-            if session_id not in sessions:
-                yield f"data: {orjson.dumps({'stage': 'error', 'message': 'Session expired'}).decode()}\n\n"
+            session = get_session(session_id)
+            if session is None:
+                yield SSE_EXPIRED_FRAME
                 break
 
-            # Get current progress
-            session = sessions[session_id]
-            progress_data = session.get("progress", {"stage": "unknown", "percent": 0})
+            # Send progress whenever set_progress() has published a new state
+            published = session.progress_frame
+            if published is not last_sent:
+                stage, frame = published
+                yield frame
+                last_sent = published
 
-            # Send progress update
-            yield f"data: {orjson.dumps(progress_data).decode()}\n\n"
+                # Check if complete or error
+                if stage in ("complete", "error"):
+                    break
+                continue
 
-            # Check if complete or error
-            if progress_data.get("stage") in ("complete", "error"):
-                break
-
-            # Send keepalive if needed
-            current_time = time.time()
-            if current_time - last_keepalive >= SSE_KEEPALIVE_INTERVAL:
-                yield ": keepalive\n\n"
-                last_keepalive = current_time
+            # Clear, then re-check, so an update racing with the clear is not lost
+            progress_event.clear()
+            if session.progress_frame is not last_sent:
+                continue
 
-            time.sleep(SSE_POLL_INTERVAL)
+            # Block until the next update; send keepalive if nothing changed
+            if not progress_event.wait(timeout=SSE_KEEPALIVE_INTERVAL):
+                yield SSE_KEEPALIVE_FRAME
 
     return Response(
-        stream_with_context(generate()),
+        generate(),
         mimetype='text/event-stream',
         headers={
             'Cache-Control': 'no-cache',
@@ -378,63 +592,67 @@ def progress(session_id):
 @limiter.limit("5 per minute")
 def process(session_id):
     """Trigger era segmentation and LLM naming for a session."""
-    if session_id not in sessions:
-        return jsonify({"error": "Session not found"}), 404
+    session = get_session(session_id)
+    if session is None:
+        return ojsonify(*SESSION_NOT_FOUND)
 
-    session = sessions[session_id]
+    # Mark active so cleanup cannot recycle the session while it is processing
+    if not touch_session(session_id, session):
+        return ojsonify(*SESSION_NOT_FOUND)
 
-    if not session.get("events"):
-        return jsonify({"error": "No events to process"}), 400
+    events = session.load_events()
+    if not events:
+        return ojsonify({"error": "No events to process"}, 400)
 
     try:
         # Calculate aggregate stats before processing (needed for API)
-        session["stats"] = calculate_aggregate_stats(session["events"])
+        session.stats = calculate_aggregate_stats(events)
 
         # Phase 1: Segmentation
-        eras = segment_listening_history(session["events"])
+        eras = segment_listening_history(events)
 
         if not eras:
-            session["progress"] = {
-                "stage": "error",
-                "message": "No distinct eras found in your listening history",
-                "percent": 0
-            }
-            return jsonify({"error": "No distinct eras found"}), 400
+            set_progress(session, "error", 0, "No distinct eras found in your listening history")
+            return ojsonify({"error": "No distinct eras found"}, 400)
 
         # Store eras and update progress
-        session["eras"] = eras
-        session["progress"] = {"stage": "segmented", "percent": 40}
+        session.eras_by_id = {era.id: era for era in eras}
+        set_progress(session, "segmented", 40)
 
         # Free memory by removing raw events (stats already preserved)
-        del session["events"]
+        session.drop_events()
+        del events
+
+        # Phase 2: LLM Naming, with each era's playlist (Phase 3) built as
+        # soon as the era is named rather than after the whole naming pass
+        playlists_by_era = {}
 
-        # Phase 2: LLM Naming
         def update_progress(percent):
-            session["progress"] = {"stage": "naming", "percent": percent}
+            set_progress(session, "naming", percent)
+
+        def add_playlist(era):
+            try:
+                playlists_by_era[era.id] = build_playlist(era)
+            except Exception:
+                # Playlist generation failed, continue without this era's playlist
+                pass
+
+        name_all_eras(eras, update_progress, on_era_named=add_playlist)
+        set_progress(session, "named", 70)
 
-        name_all_eras(eras, update_progress)
-        session["progress"] = {"stage": "named", "percent": 70}
+        session.playlists_by_era = playlists_by_era
+        set_progress(session, "playlists", 80)
 
-        # Phase 3: Playlist Generation
-        session["progress"] = {"stage": "playlists", "percent": 80}
-        try:
-            playlists = build_all_playlists(eras)
-            session["playlists"] = playlists
-        except Exception:
-            # Playlist generation failed, continue with empty playlists
-            session["playlists"] = []
+        # Serialize GET payloads before flagging completion so readers never miss them
+        cache_era_payloads(session)
 
-        session["progress"] = {"stage": "complete", "percent": 100}
+        set_progress(session, "complete", 100)
 
-        return jsonify({"status": "ok", "era_count": len(eras)})
+        return ojsonify({"status": "ok", "era_count": len(eras)})
 
     except Exception as e:
-        session["progress"] = {
-            "stage": "error",
-            "message": str(e),
-            "percent": 0
-        }
-        return jsonify({"error": f"Processing failed: {e}"}), 500
+        set_progress(session, "error", 0, str(e))
+        return ojsonify({"error": f"Processing failed: {e}"}, 500)
 
 
 @app.route('/session/<session_id>/summary', methods=['GET'])
@@ -442,18 +660,9 @@ def get_summary(session_id):
     """Get summary statistics for a completed session."""
     session, error = validate_session_ready(session_id)
     if error:
-        return jsonify(error[0]), error[1]
-
-    stats = session["stats"]
-    eras = session["eras"]
+        return ojsonify(error[0], error[1])
 
-    return jsonify({
-        "total_eras": len(eras),
-        "date_range": stats["date_range"],
-        "total_listening_time_ms": stats["total_ms"],
-        "total_tracks": stats["total_tracks"],
-        "total_artists": stats["total_artists"]
-    })
+    return cached_json_response(session.summary_bytes, session.summary_etag)
 
 
 @app.route('/session/<session_id>/eras', methods=['GET'])
@@ -461,10 +670,9 @@ def get_eras(session_id):
     """Get list of all eras for a completed session."""
     session, error = validate_session_ready(session_id)
     if error:
-        return jsonify(error[0]), error[1]
+        return ojsonify(error[0], error[1])
 
-    eras = sorted(session["eras"], key=lambda e: e.start_date)
-    return jsonify([serialize_era_summary(era) for era in eras])
+    return cached_json_response(session.eras_summary_bytes, session.eras_summary_etag)
 
 
 @app.route('/session/<session_id>/eras/<era_id>', methods=['GET'])
@@ -472,29 +680,28 @@ def get_era_detail(session_id, era_id):
     """Get detailed information for a specific era."""
     session, error = validate_session_ready(session_id)
     if error:
-        return jsonify(error[0]), error[1]
+        return ojsonify(error[0], error[1])
 
     # Validate era_id format
     try:
         era_id = int(era_id)
     except ValueError:
-        return jsonify({"error": "Invalid era_id format"}), 400
+        return ojsonify({"error": "Invalid era_id format"}, 400)
 
-    # Find era
-    era = next((e for e in session["eras"] if e.id == era_id), None)
-    if not era:
-        return jsonify({"error": "Era not found"}), 404
+    payload = session.era_detail_bytes.get(era_id)
+    if payload is None:
+        return ojsonify({"error": "Era not found"}, 404)
 
-    # Find associated playlist
-    playlist = next((p for p in session["playlists"] if p.era_id == era_id), None)
-
-    return jsonify(serialize_era_detail(era, playlist))
+    return cached_json_response(payload, session.era_detail_etags[era_id])
 
 
 # ===========================================================================
 # SPOTIFY API ENDPOINTS
 # ===========================================================================
 
+get_name = itemgetter('name')
+
+
 @app.route('/api/recommendations', methods=['GET'])
 @limiter.limit("10 per minute")
 def api_get_recommendations():
@@ -503,22 +710,20 @@ def api_get_recommendations():
         tracks = get_recommendations(limit=10)
         
         # Format for frontend
-        songs = []
-        for track in tracks:
-            songs.append({
-                'id': track['id'],
-                'track': track['name'],
-                'artist': ', '.join([artist['name'] for artist in track['artists']]),
-                'uri': track['uri'],
-                'preview_url': track.get('preview_url'),
-                'album_art': track['album']['images'][0]['url'] if track['album'].get('images') else None,
-                'genre': []  # Spotify doesn't provide genre per track
-            })
+        songs = [{
+            'id': track['id'],
+            'track': track['name'],
+            'artist': ', '.join(map(get_name, track['artists'])),
+            'uri': track['uri'],
+            'preview_url': track.get('preview_url'),
+            'album_art': track['album']['images'][0]['url'] if track['album'].get('images') else None,
+            'genre': []  # Spotify doesn't provide genre per track
+        } for track in tracks]
         
-        return jsonify({'songs': songs})
+        return ojsonify({'songs': songs})
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}, 500)
 
 
 @app.route('/api/playlist/create', methods=['POST'])
@@ -533,7 +738,7 @@ def api_create_playlist():
         disliked_tracks = data.get('disliked_tracks', [])
         
         if not liked_tracks:
-            return jsonify({'error': 'No tracks to add'}), 400
+            return ojsonify({'error': 'No tracks to add'}, 400)
         
         # AI: Analyze taste
         taste_analysis = analyze_music_taste(liked_tracks, disliked_tracks)
@@ -552,11 +757,11 @@ def api_create_playlist():
         playlist = create_playlist(ai_playlist_name, playlist_description, public=False)
         
         # Add tracks
-        track_uris = [track['uri'] for track in liked_tracks if track.get('uri')]
+        track_uris = [uri for track in liked_tracks if (uri := track.get('uri'))]
         if track_uris:
             add_tracks_to_playlist(playlist['id'], track_uris)
         
-        return jsonify({
+        return ojsonify({
             'success': True,
             'playlist': {
                 'id': playlist['id'],
@@ -568,7 +773,7 @@ def api_create_playlist():
         })
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}, 500)
 
 
 @app.route('/api/taste-analysis', methods=['POST'])
@@ -588,13 +793,13 @@ def api_taste_analysis():
         # AI: Detect mood
         mood_analysis = detect_session_mood(liked_songs, disliked_songs)
         
-        return jsonify({
+        return ojsonify({
             'taste': taste_analysis,
             'mood': mood_analysis
         })
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}, 500)
 
 
 if __name__ == '__main__':
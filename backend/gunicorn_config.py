@@ -7,8 +7,14 @@ bind = f"0.0.0.0:{os.getenv('PORT', 5001)}"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = 'sync'
+# Upload sessions and progress streams live in process memory, so a request
+# must land on the process that created its session: run one process and
+# get concurrency from threads. Spotify/OpenAI calls and SSE streams spend
+# their time waiting on I/O, which releases the GIL, so a blocked request
+# only occupies its own thread instead of a whole worker.
+workers = 1
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', multiprocessing.cpu_count() * 4))
 worker_connections = 1000
 timeout = 30
 keepalive = 2
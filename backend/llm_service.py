@@ -1,9 +1,13 @@
 import os
 import re
-import json
-import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
 import functools
-from typing import List, Callable
+from typing import List, Callable, Optional
+
+import orjson
 
 from models import Era
 
@@ -19,65 +23,126 @@ DEFAULT_MODELS = {
 
 LLM_MODEL = os.getenv('LLM_MODEL', DEFAULT_MODELS.get(LLM_PROVIDER, 'gpt-4o-mini'))
 
-# Client cache
-_client = None
+# Max LLM requests in flight while naming a batch of eras
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '8'))
+
+# Optional sqlite file caching era names by prompt; unset disables the cache
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH')
+
+# Name cache connection (shared across request threads, guarded by the lock)
+_cache_conn = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache_conn():
+    global _cache_conn
+
+    if _cache_conn is None:
+        _cache_conn = sqlite3.connect(LLM_CACHE_PATH, check_same_thread=False)
+        _cache_conn.execute(
+            "CREATE TABLE IF NOT EXISTS era_names ("
+            "prompt_hash TEXT PRIMARY KEY, title TEXT NOT NULL, summary TEXT NOT NULL)"
+        )
+    return _cache_conn
+
+
+def prompt_cache_key(prompt: str) -> str:
+    """Hash a prompt together with the provider/model that would answer it."""
+    return hashlib.sha256(f"{LLM_PROVIDER}:{LLM_MODEL}\n{prompt}".encode()).hexdigest()
 
 
-def get_client():
-    """Get or create the LLM client based on provider configuration."""
-    global _client
+def get_cached_name(prompt: str) -> Optional[dict]:
+    """Look up a previously generated name for this exact prompt."""
+    if not LLM_CACHE_PATH:
+        return None
+
+    try:
+        with _cache_lock:
+            row = _get_cache_conn().execute(
+                "SELECT title, summary FROM era_names WHERE prompt_hash = ?",
+                (prompt_cache_key(prompt),)
+            ).fetchone()
+    except sqlite3.Error:
+        return None
 
-    if _client is not None:
-        return _client
+    if row is None:
+        return None
+    return {"title": row[0], "summary": row[1]}
 
+
+def cache_name(prompt: str, response: dict) -> None:
+    """Store an LLM-generated name; cache failures never fail naming."""
+    if not LLM_CACHE_PATH:
+        return
+
+    try:
+        with _cache_lock:
+            conn = _get_cache_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO era_names (prompt_hash, title, summary) VALUES (?, ?, ?)",
+                (prompt_cache_key(prompt), str(response["title"]), str(response["summary"]))
+            )
+            conn.commit()
+    except sqlite3.Error:
+        pass
+
+
+def create_async_client():
+    """
+    Create an async LLM client based on provider configuration.
+
+    Not cached: an async client's connection pool is bound to the event loop
+    it first runs on, and each batch of eras is named in its own asyncio.run()
+    loop.
+    """
     if LLM_PROVIDER == 'openai':
         api_key = os.getenv('OPENAI_API_KEY')
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable not set")
 
-        from openai import OpenAI
-        _client = OpenAI(api_key=api_key, timeout=LLM_TIMEOUT)
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=api_key, timeout=LLM_TIMEOUT)
 
     elif LLM_PROVIDER == 'anthropic':
         api_key = os.getenv('ANTHROPIC_API_KEY')
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY environment variable not set")
 
-        from anthropic import Anthropic
-        _client = Anthropic(api_key=api_key, timeout=LLM_TIMEOUT)
+        from anthropic import AsyncAnthropic
+        return AsyncAnthropic(api_key=api_key, timeout=LLM_TIMEOUT)
 
     else:
         raise ValueError(f"Unknown LLM provider: {LLM_PROVIDER}")
 
-    return _client
+
+def is_retryable_error(e: Exception) -> bool:
+    """Check if an LLM error is worth retrying."""
+    error_str = str(e).lower()
+    return any(term in error_str for term in [
+        'rate limit', 'timeout', 'connection',
+        'server error', '500', '502', '503', '529'
+    ])
 
 
-def retry_with_backoff(max_retries=3, base_delay=1):
-    """Decorator for retrying functions with exponential backoff."""
+def retry_with_backoff_async(max_retries=3, base_delay=1):
+    """Decorator for retrying coroutines with exponential backoff."""
     def decorator(func):
         @functools.wraps(func)
-        def wrapper(*args, **kwargs):
+        async def wrapper(*args, **kwargs):
             last_exception = None
 
             for attempt in range(max_retries):
                 try:
-                    return func(*args, **kwargs)
+                    return await func(*args, **kwargs)
                 except Exception as e:
                     last_exception = e
-                    error_str = str(e).lower()
 
-                    # Check if it's a retryable error
-                    retryable = any(term in error_str for term in [
-                        'rate limit', 'timeout', 'connection',
-                        'server error', '500', '502', '503', '529'
-                    ])
-
-                    if not retryable or attempt == max_retries - 1:
+                    if not is_retryable_error(e) or attempt == max_retries - 1:
                         raise
 
                     # Exponential backoff: 1s, 2s, 4s
                     delay = base_delay * (2 ** attempt)
-                    time.sleep(delay)
+                    await asyncio.sleep(delay)
 
             raise last_exception
 
@@ -97,6 +162,21 @@ def format_duration(days: int) -> str:
         return f"{months} month{'s' if months != 1 else ''}"
 
 
+# Static parts of the era prompt
+PROMPT_HEADER = (
+    "You are analyzing someone's music listening history. "
+    "Based on this era's data, create a creative title and summary."
+)
+PROMPT_INSTRUCTIONS = """Create a JSON response with:
+- "title": A creative, evocative 2-5 word title that captures the mood/vibe. Avoid generic titles like "Musical Journey", "Eclectic Mix", or "Summer Vibes".
+- "summary": A 2-3 sentence summary describing the musical mood, themes, or story of this era.
+
+Respond ONLY with valid JSON: {"title": "...", "summary": "..."}"""
+
+# Outermost {...} span, for responses that wrap the JSON in prose or fences
+JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+
 def build_era_prompt(era: Era) -> str:
     """
     Build a prompt for the LLM to name and summarize an era.
@@ -135,7 +215,7 @@ def build_era_prompt(era: Era) -> str:
         tracks_lines.append(f"{i}. {track} by {artist} ({count} plays)")
     formatted_tracks = "\n".join(tracks_lines)
 
-    prompt = f"""You are analyzing someone's music listening history. Based on this era's data, create a creative title and summary.
+    prompt = f"""{PROMPT_HEADER}
 
 Era: {date_range} ({duration})
 Total listening time: {listening_time}
@@ -146,11 +226,7 @@ Top Artists:
 Top Tracks:
 {formatted_tracks}
 
-Create a JSON response with:
-- "title": A creative, evocative 2-5 word title that captures the mood/vibe. Avoid generic titles like "Musical Journey", "Eclectic Mix", or "Summer Vibes".
-- "summary": A 2-3 sentence summary describing the musical mood, themes, or story of this era.
-
-Respond ONLY with valid JSON: {{"title": "...", "summary": "..."}}"""
+{PROMPT_INSTRUCTIONS}"""
 
     return prompt
 
@@ -181,82 +257,86 @@ def parse_llm_response(response_text: str) -> dict:
     """
     # Try direct JSON parse first
     try:
-        return json.loads(response_text)
-    except json.JSONDecodeError:
+        return orjson.loads(response_text)
+    except orjson.JSONDecodeError:
         pass
 
     # Try to extract JSON from response using regex
-    match = re.search(r'\{.*\}', response_text, re.DOTALL)
+    match = JSON_OBJECT_RE.search(response_text)
     if match:
         try:
-            return json.loads(match.group())
-        except json.JSONDecodeError:
+            return orjson.loads(match.group())
+        except orjson.JSONDecodeError:
             pass
 
     return None
 
 
-@retry_with_backoff(max_retries=3, base_delay=1)
-def call_llm(prompt: str) -> str:
+def _append_delta(parts: List[str], delta: Optional[str]) -> bool:
     """
-    Call the LLM API with the given prompt.
+    Append a streamed text delta to parts.
+
+    Returns True once the text so far parses to an object with both keys, so
+    the caller can stop reading the stream instead of waiting for it to end.
+    """
+    if not delta:
+        return False
+    parts.append(delta)
+    if '}' not in delta:
+        return False
+    parsed = parse_llm_response(''.join(parts))
+    return isinstance(parsed, dict) and "title" in parsed and "summary" in parsed
+
+
+@retry_with_backoff_async(max_retries=3, base_delay=1)
+async def call_llm_async(client, prompt: str) -> str:
+    """
+    Call the LLM API with the given prompt on an async client.
+
+    The response is streamed and reading stops as soon as it holds a
+    complete {"title", "summary"} object.
 
     Args:
+        client: Client from create_async_client()
         prompt: The prompt to send
 
     Returns:
         Response text from the LLM
     """
-    client = get_client()
+    parts = []
 
     if LLM_PROVIDER == 'openai':
-        response = client.chat.completions.create(
+        stream = await client.chat.completions.create(
             model=LLM_MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7,
-            max_tokens=300
+            max_tokens=300,
+            stream=True
         )
-        return response.choices[0].message.content
+        try:
+            async for chunk in stream:
+                if chunk.choices and _append_delta(parts, chunk.choices[0].delta.content):
+                    break
+        finally:
+            await stream.close()
+        return ''.join(parts)
 
     elif LLM_PROVIDER == 'anthropic':
-        response = client.messages.create(
+        async with client.messages.stream(
             model=LLM_MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7,
             max_tokens=300
-        )
-        return response.content[0].text
+        ) as stream:
+            async for text in stream.text_stream:
+                if _append_delta(parts, text):
+                    break
+        return ''.join(parts)
 
     else:
         raise ValueError(f"Unknown LLM provider: {LLM_PROVIDER}")
 
 
-def name_era(era: Era) -> dict:
-    """
-    Generate a title and summary for an era using LLM.
-
-    Args:
-        era: Era object with listening data
-
-    Returns:
-        Dict with "title" and "summary" keys
-    """
-    try:
-        prompt = build_era_prompt(era)
-        response_text = call_llm(prompt)
-        parsed = parse_llm_response(response_text)
-
-        if parsed and "title" in parsed and "summary" in parsed:
-            return parsed
-
-        # Parsing failed, use fallback
-        return get_fallback_response(era)
-
-    except Exception:
-        # Any error, use fallback
-        return get_fallback_response(era)
-
-
 def validate_era_name(response: dict, era: Era) -> dict:
     """
     Validate and clean LLM response.
@@ -305,23 +385,96 @@ def validate_era_name(response: dict, era: Era) -> dict:
     return {"title": title, "summary": summary}
 
 
-def name_all_eras(eras: List[Era], progress_callback: Callable[[int], None]) -> List[Era]:
+async def name_era_async(client, era: Era) -> dict:
+    """
+    Generate a title and summary for an era using the LLM.
+
+    Args:
+        client: Client from create_async_client(), or None to use the fallback
+        era: Era object with listening data
+
+    Returns:
+        Dict with "title" and "summary" keys
+    """
+    try:
+        prompt = build_era_prompt(era)
+        cached = get_cached_name(prompt)
+        if cached is not None:
+            return cached
+
+        if client is None:
+            return get_fallback_response(era)
+
+        response_text = await call_llm_async(client, prompt)
+        parsed = parse_llm_response(response_text)
+
+        if parsed and "title" in parsed and "summary" in parsed:
+            cache_name(prompt, parsed)
+            return parsed
+
+        # Parsing failed, use fallback
+        return get_fallback_response(era)
+
+    except Exception:
+        # Any error, use fallback
+        return get_fallback_response(era)
+
+
+async def name_eras_batch(eras: List[Era], on_response: Callable[[Era, dict], None]) -> None:
+    """
+    Request names for all eras concurrently, at most LLM_CONCURRENCY at a time.
+
+    Args:
+        eras: List of Era objects to name
+        on_response: Called with (era, response) as each request finishes
+    """
+    try:
+        client = create_async_client()
+    except Exception:
+        # Misconfigured provider; every era gets its fallback
+        client = None
+
+    semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+    async def worker(era: Era) -> None:
+        async with semaphore:
+            response = await name_era_async(client, era)
+        on_response(era, response)
+
+    try:
+        await asyncio.gather(*(worker(era) for era in eras))
+    finally:
+        if client is not None:
+            await client.close()
+
+
+def name_all_eras(
+    eras: List[Era],
+    progress_callback: Callable[[int], None],
+    on_era_named: Optional[Callable[[Era], None]] = None
+) -> List[Era]:
     """
     Generate titles and summaries for all eras.
 
+    Requests run concurrently, so eras may finish (and be reported to
+    on_era_named) in any order.
+
     Args:
         eras: List of Era objects to name
         progress_callback: Function to call with progress percentage (40-70)
+        on_era_named: Optional function called with each era as soon as it is
+                      named, so callers can start follow-up work early
 
     Returns:
         List of Era objects with title and summary populated
     """
     total = len(eras)
+    completed = 0
+
+    def apply_response(era: Era, response: dict) -> None:
+        nonlocal completed
 
-    for i, era in enumerate(eras):
         try:
-            # Get name from LLM
-            response = name_era(era)
             # Validate and clean
             validated = validate_era_name(response, era)
             # Update era
@@ -334,8 +487,15 @@ def name_all_eras(eras: List[Era], progress_callback: Callable[[int], None]) ->
             era.title = fallback["title"]
             era.summary = fallback["summary"]
 
+        if on_era_named is not None:
+            on_era_named(era)
+
         # Update progress (40% to 70% range)
-        progress = 40 + int((i + 1) / total * 30)
+        completed += 1
+        progress = 40 + int(completed / total * 30)
         progress_callback(progress)
 
+    if eras:
+        asyncio.run(name_eras_batch(eras, apply_response))
+
     return eras
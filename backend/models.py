@@ -1,16 +1,65 @@
-from collections import Counter
-from dataclasses import dataclass
-from datetime import datetime, date
-from typing import List, Optional, Tuple
+import pickle
+import threading
+import zlib
+from dataclasses import dataclass, field
+from datetime import date
+from functools import cached_property
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# Histories smaller than this are kept as-is; compressing them saves too little
+EVENTS_COMPRESS_MIN = 10_000
+
+class StringTable:
+    """Assigns each distinct string a dense int id, in first-seen order."""
+    __slots__ = ('ids', 'names')
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def intern(self, name: str) -> int:
+        """Return the id for name, adding it to the table if new."""
+        ids = self.ids
+        id_ = ids.get(name)
+        if id_ is None:
+            id_ = ids[name] = len(self.names)
+            self.names.append(name)
+        return id_
+
+    def __len__(self) -> int:
+        return len(self.names)
 
 
 @dataclass
-class ListeningEvent:
-    timestamp: datetime
-    artist_name: str
-    track_name: str
-    ms_played: int
-    spotify_uri: Optional[str] = None
+class ListeningHistory:
+    """
+    Listening events stored column-wise (struct of arrays).
+
+    Row i is one play; artist/track names are stored once in the name tables
+    and referenced by index, so a play costs ~24 bytes instead of an object.
+    The tables only hold names that occur in at least one row.
+    """
+    timestamps: np.ndarray  # int64 UTC epoch seconds
+    ms_played: np.ndarray  # int64
+    artist_ids: np.ndarray  # int32 index into artists
+    track_ids: np.ndarray  # int32 index into tracks
+    artists: List[str]  # artist_name by id
+    tracks: List[str]  # track_name by id
+
+    def __len__(self) -> int:
+        return int(self.timestamps.size)
+
+    def compress(self) -> bytes:
+        """Serialize to a zlib blob for keeping an idle history in memory."""
+        return zlib.compress(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+    @staticmethod
+    def decompress(blob: bytes) -> 'ListeningHistory':
+        """Inverse of compress()."""
+        return pickle.loads(zlib.decompress(blob))
 
 
 @dataclass
@@ -24,17 +73,122 @@ class Era:
     title: str = ""
     summary: str = ""
 
+    @cached_property
+    def top_artists_serialized(self) -> List[dict]:
+        """top_artists as API dicts, built once per era."""
+        return [{"name": name, "plays": count} for name, count in self.top_artists]
 
-@dataclass
+    @cached_property
+    def top_tracks_serialized(self) -> List[dict]:
+        """top_tracks as API dicts, built once per era."""
+        return [{"track": track, "artist": artist, "plays": count} for track, artist, count in self.top_tracks]
+
+
+@dataclass(slots=True)
+class PlaylistTrack:
+    """One playlist entry; orjson serializes it as a dict in field order."""
+    track_name: str
+    artist_name: str
+    play_count: int
+    uri: Optional[str] = None  # Not available after aggregation
+
+
+@dataclass(slots=True)
 class Playlist:
     era_id: int
-    tracks: List[dict]  # {track_name, artist_name, uri}
+    tracks: List[PlaylistTrack]
 
 
 @dataclass
-class WeekBucket:
-    week_key: Tuple[int, int]  # (year, week_number) to handle year boundaries
-    week_start: date
-    artists: Counter  # Counter of artist_name -> play_count
-    tracks: Counter  # Counter of (track_name, artist_name) -> play_count
-    total_ms: int
+class WeekTable:
+    """
+    Per-week play counts for a listening history, stored column-wise.
+
+    Rows are grouped CSR-style: week w's artist counts are
+    artist_keys[artist_ptr[w]:artist_ptr[w + 1]] with matching artist_counts,
+    keyed by artist_id in first-played order. Tracks are laid out the same
+    way, keyed by track_id * n_artists + artist_id.
+    """
+    week_starts: List[date]  # Monday of each week, ascending
+    week_days: np.ndarray  # int64 epoch day number of each week_start
+    total_ms: np.ndarray  # int64 per week
+    artist_ptr: np.ndarray  # int64, len(weeks) + 1
+    artist_keys: np.ndarray  # int64 artist_id
+    artist_counts: np.ndarray  # int64
+    track_ptr: np.ndarray  # int64, len(weeks) + 1
+    track_keys: np.ndarray  # int64 track_id * n_artists + artist_id
+    track_counts: np.ndarray  # int64
+    n_artists: int
+    # (weeks, 20) int64: each week's top artist ids by plays, ties in
+    # first-played order, padded with -1 past the week's distinct artists
+    top_artist_ids: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.week_starts)
+
+
+@dataclass(slots=True)
+class Session:
+    """In-memory state for one uploaded listening history."""
+    events: Optional[ListeningHistory]
+    progress_stage: str = "uploading"
+    progress_message: Optional[str] = None
+    progress_frame: Tuple[str, bytes] = ("uploading", b"")  # (stage, SSE frame), swapped in one assignment
+    progress_event: threading.Event = field(default_factory=threading.Event)
+    stats: dict = field(default_factory=dict)
+    eras_by_id: Dict[int, Era] = field(default_factory=dict)
+    playlists_by_era: Dict[int, Playlist] = field(default_factory=dict)
+    summary_bytes: bytes = b""
+    summary_etag: str = ""
+    eras_summary_bytes: bytes = b""
+    eras_summary_etag: str = ""
+    era_detail_bytes: Dict[int, bytes] = field(default_factory=dict)
+    era_detail_etags: Dict[int, str] = field(default_factory=dict)
+    events_blob: Optional[bytes] = None  # compressed events while waiting for /process
+
+    def ready(self) -> Tuple[Optional['Session'], Optional[Tuple[dict, int]]]:
+        """Return (self, None) once processing is complete, else (None, (error, status))."""
+        stage = self.progress_stage
+        if stage == "complete":
+            return self, None
+        if stage == "error":
+            return None, ({"error": self.progress_message or "Processing failed"}, 400)
+        return None, ({"error": "Processing not complete", "stage": stage}, 425)
+
+    def store_events(self, history: ListeningHistory) -> None:
+        """Keep parsed events until /process, compressed if the history is large."""
+        if len(history) >= EVENTS_COMPRESS_MIN:
+            self.events = None
+            self.events_blob = history.compress()
+        else:
+            self.events = history
+            self.events_blob = None
+
+    def load_events(self) -> Optional[ListeningHistory]:
+        """Return the stored events, decompressing them if needed."""
+        if self.events_blob is not None:
+            return ListeningHistory.decompress(self.events_blob)
+        return self.events
+
+    def drop_events(self) -> None:
+        self.events = None
+        self.events_blob = None
+
+    def reset(self) -> None:
+        """Drop per-upload data so the instance can be reused from a pool."""
+        self.drop_events()
+        self.stats.clear()
+        self.eras_by_id.clear()
+        self.playlists_by_era.clear()
+        self.era_detail_bytes.clear()
+        self.era_detail_etags.clear()
+        self.summary_bytes = b""
+        self.summary_etag = ""
+        self.eras_summary_bytes = b""
+        self.eras_summary_etag = ""
+        # Back to the initial progress state, so a pooled session is neither
+        # ready() nor still holding the previous upload's last SSE frame
+        self.progress_stage = "uploading"
+        self.progress_message = None
+        self.progress_frame = ("uploading", b"")
+        self.progress_event.clear()
@@ -1,26 +1,43 @@
 import fnmatch
 import io
+import multiprocessing
 import os
+import threading
 import zipfile
-from datetime import datetime
-from typing import List
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import BinaryIO, List, Optional, Tuple
 
+import numpy as np
 import orjson
 
-from models import ListeningEvent
+from models import ListeningHistory, StringTable
 
 
 # Security limits
 MAX_EXTRACTED_SIZE = 1024 * 1024 * 1024  # 1GB max total extracted size
 STREAMING_HISTORY_PATTERN = '*Streaming_History_Audio_*.json'
 
+# Bytes JSON allows around a value (RFC 8259)
+JSON_WHITESPACE = b' \t\r\n'
+
+# Archives whose history members inflate to at least this much are parsed on a
+# process pool; below it, shipping bytes to workers costs more than it saves
+PROCESS_POOL_MIN_BYTES = 64 * 1024 * 1024  # 64MB
+
+# Shared process pool for large archives (see _get_process_pool)
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
 
 class ParseError(Exception):
     """Raised when parsing fails."""
     pass
 
 
-def parse_spotify_json(file_content: bytes) -> List[ListeningEvent]:
+def parse_spotify_json(file_content: bytes) -> ListeningHistory:
     """
     Parse a single Spotify extended streaming history JSON file.
 
@@ -28,11 +45,19 @@ def parse_spotify_json(file_content: bytes) -> List[ListeningEvent]:
         file_content: Raw bytes of the JSON file
 
     Returns:
-        List of ListeningEvent objects
+        ListeningHistory with one row per play, in file order
 
     Raises:
         ParseError: If JSON is malformed or data is invalid
     """
+    # Reject non-arrays (e.g. an HTML error page saved as .json) before
+    # paying for a full parse
+    start, end = _strip_json_whitespace(file_content)
+    if start == end or file_content[start] != 0x5B:  # '['
+        raise ParseError("Expected JSON array of listening events")
+    if file_content[end - 1] != 0x5D:  # ']'
+        raise ParseError("Invalid JSON: array is not terminated")
+
     try:
         data = orjson.loads(file_content)
     except orjson.JSONDecodeError as e:
@@ -41,20 +66,34 @@ def parse_spotify_json(file_content: bytes) -> List[ListeningEvent]:
     if not isinstance(data, list):
         raise ParseError("Expected JSON array of listening events")
 
-    events = []
+    # Typed buffers hold 4-8 bytes per value (a list holds a pointer to an
+    # int object per value) and are wrapped by numpy below without a copy
+    timestamps = array('q')
+    ms_column = array('q')
+    artist_ids = array('i')
+    track_ids = array('i')
+    # Every play of an artist/track shares one table entry
+    # (exports repeat a few thousand names across tens of thousands of plays)
+    artist_table = StringTable()
+    track_table = StringTable()
     seen = set()  # For deduplication
 
     for entry in data:
-        # Skip entries with missing required fields
-        track_name = entry.get('master_metadata_track_name')
-        artist_name = entry.get('master_metadata_album_artist_name')
-        ms_played = entry.get('ms_played', 0)
-        ts = entry.get('ts')
-
-        # Filter out invalid entries
-        if track_name is None or artist_name is None:
+        # Skip entries with missing required fields. Nearly every entry has
+        # all of them, so indexing and catching the rare miss beats .get(),
+        # and the cheapest check (short plays) rejects entries first
+        try:
+            ms_played = entry['ms_played']
+            if ms_played < 30000:  # Less than 30 seconds
+                continue
+            track_name = entry['master_metadata_track_name']
+            artist_name = entry['master_metadata_album_artist_name']
+            ts = entry['ts']
+        except (KeyError, TypeError):
             continue
-        if ms_played < 30000:  # Less than 30 seconds
+
+        # Filter out invalid entries (None for podcasts/unknown metadata)
+        if not isinstance(track_name, str) or not isinstance(artist_name, str):
             continue
         if ts is None:
             continue
@@ -64,26 +103,64 @@ def parse_spotify_json(file_content: bytes) -> List[ListeningEvent]:
             timestamp = datetime.fromisoformat(ts.replace('Z', '+00:00'))
         except (ValueError, AttributeError):
             continue  # Skip entries with invalid timestamps
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
 
-        # Deduplicate by (timestamp, track, artist)
-        dedup_key = (ts, track_name, artist_name)
+        seconds = int(timestamp.timestamp())
+        artist_id = artist_table.intern(artist_name)
+        track_id = track_table.intern(track_name)
+
+        # Deduplicate by (timestamp, track, artist). Keyed on the raw ts
+        # string, not the parsed seconds, so only exact repeats collapse;
+        # the name ids (< 2**32) pack into one int
+        dedup_key = (ts, (track_id << 32) | artist_id)
         if dedup_key in seen:
             continue
         seen.add(dedup_key)
 
-        event = ListeningEvent(
-            timestamp=timestamp,
-            artist_name=artist_name,
-            track_name=track_name,
-            ms_played=ms_played,
-            spotify_uri=entry.get('spotify_track_uri')
-        )
-        events.append(event)
+        timestamps.append(seconds)
+        ms_column.append(int(ms_played))
+        artist_ids.append(artist_id)
+        track_ids.append(track_id)
+
+    return ListeningHistory(
+        timestamps=np.frombuffer(timestamps, dtype=np.int64),
+        ms_played=np.frombuffer(ms_column, dtype=np.int64),
+        artist_ids=np.frombuffer(artist_ids, dtype=np.int32),
+        track_ids=np.frombuffer(track_ids, dtype=np.int32),
+        artists=artist_table.names,
+        tracks=track_table.names,
+    )
+
+
+def _strip_json_whitespace(content: bytes) -> Tuple[int, int]:
+    """Return the [start, end) bounds of content without surrounding JSON whitespace, without copying."""
+    start, end = 0, len(content)
+    while start < end and content[start] in JSON_WHITESPACE:
+        start += 1
+    while end > start and content[end - 1] in JSON_WHITESPACE:
+        end -= 1
+    return start, end
+
+
+def parse_spotify_json_stream(fp: BinaryIO) -> ListeningHistory:
+    """
+    Parse a Spotify extended streaming history JSON file from a file object.
+
+    Args:
+        fp: Binary file object positioned at the start of the JSON document
+
+    Returns:
+        ListeningHistory with one row per play, in file order
 
-    return events
+    Raises:
+        ParseError: If JSON is malformed or data is invalid
+    """
+    # orjson needs the whole document; reading bytes skips any str decode copy
+    return parse_spotify_json(fp.read())
 
 
-def parse_spotify_zip(zip_bytes: bytes) -> List[ListeningEvent]:
+def parse_spotify_zip(zip_bytes: bytes) -> ListeningHistory:
     """
     Parse a Spotify data export ZIP file.
 
@@ -91,20 +168,41 @@ def parse_spotify_zip(zip_bytes: bytes) -> List[ListeningEvent]:
         zip_bytes: Raw bytes of the ZIP file
 
     Returns:
-        List of ListeningEvent objects, sorted by timestamp
+        ListeningHistory of all members, sorted by timestamp
 
     Raises:
         ParseError: If ZIP is invalid or contains security issues
     """
-    bytes_io = io.BytesIO(zip_bytes)
+    return parse_spotify_zip_stream(io.BytesIO(zip_bytes))
+
+
+def parse_spotify_zip_stream(fp: BinaryIO) -> ListeningHistory:
+    """
+    Parse a Spotify data export ZIP file from a seekable file object.
+
+    Members are read straight from the archive, so it never needs to be held
+    in memory (e.g. an upload spooled to a temporary file). Matching members
+    are parsed on a thread pool, or on a process pool for large exports where
+    the GIL-bound JSON decoding dominates.
+
+    Args:
+        fp: Seekable binary file object containing the ZIP archive
 
-    if not zipfile.is_zipfile(bytes_io):
+    Returns:
+        ListeningHistory of all members, sorted by timestamp
+
+    Raises:
+        ParseError: If ZIP is invalid or contains security issues
+    """
+    if not zipfile.is_zipfile(fp):
         raise ParseError("Invalid ZIP file")
 
-    all_events = []
+    chunks = []
     total_extracted = 0
+    member_names = []
+    member_bytes = 0
 
-    with zipfile.ZipFile(bytes_io, 'r') as zf:
+    with zipfile.ZipFile(fp, 'r') as zf:
         for info in zf.infolist():
             # Security: skip directories
             if info.is_dir():
@@ -123,22 +221,128 @@ def parse_spotify_zip(zip_bytes: bytes) -> List[ListeningEvent]:
             # Check if file matches streaming history pattern
             # Handle nested directories by checking just the basename
             basename = os.path.basename(filename)
-            if not fnmatch.fnmatch(basename, STREAMING_HISTORY_PATTERN):
-                continue
+            if fnmatch.fnmatch(basename, STREAMING_HISTORY_PATTERN):
+                member_names.append(filename)
+                member_bytes += info.file_size
 
-            # Extract and parse the JSON file
-            try:
-                file_content = zf.read(info.filename)
-                events = parse_spotify_json(file_content)
-                all_events.extend(events)
-            except ParseError:
-                # Skip files that fail to parse, continue with others
-                continue
+        if len(member_names) > 1 and member_bytes >= PROCESS_POOL_MIN_BYTES:
+            chunks = _parse_members_in_processes(zf, member_names)
+        elif member_names:
+            chunks = _parse_members_in_threads(zf, member_names)
 
-    if not all_events:
+    if not chunks:
         raise ParseError("No valid streaming history files found in ZIP")
 
-    # Sort by timestamp ascending
-    all_events.sort(key=lambda e: e.timestamp)
+    history = merge_histories(chunks)
+
+    # Sort by timestamp ascending (stable, so equal timestamps keep file order).
+    # Exports are usually chronological already; one O(n) check skips the
+    # argsort and the four column gathers in that case
+    timestamps = history.timestamps
+    if timestamps.size > 1 and (timestamps[1:] < timestamps[:-1]).any():
+        order = np.argsort(timestamps, kind='stable')
+        history.timestamps = timestamps[order]
+        history.ms_played = history.ms_played[order]
+        history.artist_ids = history.artist_ids[order]
+        history.track_ids = history.track_ids[order]
+
+    return history
+
+
+def _parse_members_in_threads(zf: zipfile.ZipFile, member_names: List[str]) -> List[ListeningHistory]:
+    """
+    Parse archive members on a thread pool, in member order.
+
+    zlib releases the GIL while inflating, so reads overlap across cores.
+    """
+    def read_member(name: str) -> Optional[ListeningHistory]:
+        # Extract and parse the JSON file
+        try:
+            return parse_spotify_json(zf.read(name))
+        except ParseError:
+            # Skip files that fail to parse, continue with others
+            return None
+
+    workers = min(len(member_names), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # map() preserves member order, keeping the merge deterministic
+        return [h for h in executor.map(read_member, member_names) if h]
+
+
+def _parse_member_content(content: bytes) -> Optional[ListeningHistory]:
+    """Process pool entry point: parse one member, None if it is unusable."""
+    try:
+        return parse_spotify_json(content)
+    except ParseError:
+        return None
+
 
-    return all_events
+def _get_process_pool() -> ProcessPoolExecutor:
+    """Create the shared parse pool on first use."""
+    global _process_pool
+
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn, not fork: the server is multi-threaded, and forking a
+            # threaded process can copy held locks into the child
+            _process_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _process_pool
+
+
+def _parse_members_in_processes(zf: zipfile.ZipFile, member_names: List[str]) -> List[ListeningHistory]:
+    """
+    Parse archive members on the process pool, in member order.
+
+    Members are inflated here and their bytes shipped to the workers; at most
+    two per worker are in flight, so memory stays bounded for large archives.
+    """
+    pool = _get_process_pool()
+    window = 2 * (os.cpu_count() or 1)
+    pending = deque()
+    chunks = []
+
+    for name in member_names:
+        pending.append(pool.submit(_parse_member_content, zf.read(name)))
+        if len(pending) >= window:
+            chunks.append(pending.popleft().result())
+    while pending:
+        chunks.append(pending.popleft().result())
+
+    return [h for h in chunks if h]
+
+
+def merge_histories(chunks: List[ListeningHistory]) -> ListeningHistory:
+    """
+    Concatenate histories, remapping each chunk's ids into shared name tables.
+
+    Args:
+        chunks: Non-empty list of ListeningHistory objects
+
+    Returns:
+        A single ListeningHistory with rows in chunk order
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+
+    artist_table = StringTable()
+    track_table = StringTable()
+    artist_columns = []
+    track_columns = []
+
+    for chunk in chunks:
+        artist_map = np.array([artist_table.intern(name) for name in chunk.artists], dtype=np.int32)
+        track_map = np.array([track_table.intern(name) for name in chunk.tracks], dtype=np.int32)
+        artist_columns.append(artist_map[chunk.artist_ids])
+        track_columns.append(track_map[chunk.track_ids])
+
+    return ListeningHistory(
+        timestamps=np.concatenate([c.timestamps for c in chunks]),
+        ms_played=np.concatenate([c.ms_played for c in chunks]),
+        artist_ids=np.concatenate(artist_columns),
+        track_ids=np.concatenate(track_columns),
+        artists=artist_table.names,
+        tracks=track_table.names,
+    )
@@ -1,6 +1,6 @@
 from typing import List
 
-from models import Era, Playlist
+from models import Era, Playlist, PlaylistTrack
 
 
 def build_playlist(era: Era) -> Playlist:
@@ -14,12 +14,7 @@ def build_playlist(era: Era) -> Playlist:
         Playlist object with formatted track list
     """
     tracks = [
-        {
-            "track_name": track_name,
-            "artist_name": artist_name,
-            "play_count": count,
-            "uri": None  # Not available after aggregation
-        }
+        PlaylistTrack(track_name, artist_name, count)
         for track_name, artist_name, count in era.top_tracks
     ]
     return Playlist(era_id=era.id, tracks=tracks)
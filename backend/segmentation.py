@@ -1,146 +1,202 @@
-from collections import Counter
-from datetime import date, timedelta
-from typing import List
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Tuple
 
-from models import ListeningEvent, WeekBucket, Era
+import numpy as np
 
+from models import ListeningHistory, WeekTable, Era
 
-def aggregate_by_week(events: List[ListeningEvent]) -> List[WeekBucket]:
+
+EPOCH_DATE = date(1970, 1, 1)
+
+# Top artists per week compared by calculate_similarity
+SIMILARITY_TOP_N = 20
+
+
+def _counts_by_week(
+    week_idx: np.ndarray, keys: np.ndarray, n_weeks: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
-    Group listening events by ISO week.
+    Count occurrences of each key within each week.
 
-    Args:
-        events: List of ListeningEvent objects
+    Returns CSR-style (ptr, keys, counts): week w's rows are ptr[w]:ptr[w + 1],
+    with keys in order of first occurrence within the week.
+    """
+    if keys.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return np.zeros(n_weeks + 1, dtype=np.int64), empty, empty
 
-    Returns:
-        List of WeekBucket objects sorted by week_start
+    # One int64 per (week, key); keys are non-negative and < key_span
+    key_span = int(keys.max()) + 1
+    packed = week_idx.astype(np.int64) * key_span + keys
+    uniq, first, counts = np.unique(packed, return_index=True, return_counts=True)
+
+    # Group by week, then order by first occurrence within each week
+    weeks_of = uniq // key_span
+    order = np.lexsort((first, weeks_of))
+    uniq, counts, weeks_of = uniq[order], counts[order], weeks_of[order]
+    ptr = np.searchsorted(weeks_of, np.arange(n_weeks + 1))
+
+    return ptr, uniq % key_span, counts.astype(np.int64)
+
+
+def _top_per_week(ptr: np.ndarray, counts: np.ndarray, keys: np.ndarray, n: int) -> np.ndarray:
     """
-    if not events:
-        return []
+    Top n keys of each week by count, ties in row (first-played) order.
 
-    # Group events by (year, week)
-    weeks_data = {}
-
-    for event in events:
-        iso_cal = event.timestamp.isocalendar()
-        week_key = (iso_cal[0], iso_cal[1])  # (year, week)
-
-        if week_key not in weeks_data:
-            # Calculate Monday of this ISO week
-            # ISO week 1 contains Jan 4, and weeks start on Monday
-            jan4 = date(iso_cal[0], 1, 4)
-            week_start = jan4 - timedelta(days=jan4.weekday()) + timedelta(weeks=iso_cal[1] - 1)
-
-            weeks_data[week_key] = {
-                'week_start': week_start,
-                'artists': Counter(),
-                'tracks': Counter(),
-                'total_ms': 0
-            }
-
-        weeks_data[week_key]['artists'][event.artist_name] += 1
-        weeks_data[week_key]['tracks'][(event.track_name, event.artist_name)] += 1
-        weeks_data[week_key]['total_ms'] += event.ms_played
-
-    # Convert to WeekBucket objects
-    buckets = [
-        WeekBucket(
-            week_key=week_key,
-            week_start=data['week_start'],
-            artists=data['artists'],
-            tracks=data['tracks'],
-            total_ms=data['total_ms']
-        )
-        for week_key, data in weeks_data.items()
-    ]
+    Returns a (weeks, n) array padded with -1 for weeks with fewer keys.
+    """
+    n_weeks = ptr.size - 1
+    if n_weeks == 0:
+        return np.full((0, n), -1, dtype=np.int64)
+
+    # One stable sort for all weeks: by week, then count descending
+    rows_week = np.repeat(np.arange(n_weeks), np.diff(ptr))
+    ranked = keys[np.lexsort((-counts, rows_week))]
+
+    cols = np.arange(n)
+    rows = np.minimum(ptr[:-1, None] + cols, ranked.size - 1)
+    return np.where(cols < np.diff(ptr)[:, None], ranked[rows], -1)
+
+
+def _top_keys(keys: np.ndarray, counts: np.ndarray, n: int) -> List[Tuple[int, int]]:
+    """
+    Sum counts per key and return the top n (key, total) pairs.
+
+    Ties keep first-occurrence order, matching Counter.most_common().
+    """
+    uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    totals = np.zeros(uniq.size, dtype=np.int64)
+    np.add.at(totals, inverse, counts)
+    order = np.lexsort((first, -totals))[:n]
+    return list(zip(uniq[order].tolist(), totals[order].tolist()))
 
-    # Sort by week_start
-    buckets.sort(key=lambda b: b.week_start)
 
-    return buckets
+def aggregate_by_week(history: ListeningHistory) -> WeekTable:
+    """
+    Group listening events by ISO week.
 
+    Args:
+        history: ListeningHistory of plays
 
-def calculate_similarity(week_a: WeekBucket, week_b: WeekBucket) -> float:
+    Returns:
+        WeekTable with one row per week that has plays, sorted by week start
+    """
+    # Epoch day number of each play's week's Monday (1970-01-01 was a Thursday)
+    days = history.timestamps // 86400
+    mondays = days - (days + 3) % 7
+
+    # Sorted unique weeks, and each play's index into them
+    week_days, week_idx = np.unique(mondays, return_inverse=True)
+    n_weeks = week_days.size
+
+    # Per-week sums stay far below 2**53, so the float bincount is exact
+    total_ms = np.bincount(week_idx, weights=history.ms_played, minlength=n_weeks).astype(np.int64)
+
+    artist_ids = history.artist_ids.astype(np.int64)
+    n_artists = len(history.artists)
+    artist_ptr, artist_keys, artist_counts = _counts_by_week(week_idx, artist_ids, n_weeks)
+    track_ptr, track_keys, track_counts = _counts_by_week(
+        week_idx, history.track_ids.astype(np.int64) * n_artists + artist_ids, n_weeks
+    )
+
+    return WeekTable(
+        week_starts=[EPOCH_DATE + timedelta(days=monday) for monday in week_days.tolist()],
+        week_days=week_days,
+        total_ms=total_ms,
+        artist_ptr=artist_ptr,
+        artist_keys=artist_keys,
+        artist_counts=artist_counts,
+        track_ptr=track_ptr,
+        track_keys=track_keys,
+        track_counts=track_counts,
+        n_artists=n_artists,
+        top_artist_ids=_top_per_week(artist_ptr, artist_counts, artist_keys, SIMILARITY_TOP_N),
+    )
+
+
+def calculate_similarity(weeks: WeekTable, a: int, b: int) -> float:
     """
     Calculate Jaccard similarity between two weeks based on top artists.
 
     Args:
-        week_a: First week bucket
-        week_b: Second week bucket
+        weeks: WeekTable holding both weeks
+        a: Index of the first week
+        b: Index of the second week
 
     Returns:
         Float between 0.0 and 1.0 representing similarity
     """
-    # Get top N artists from each week
-    n = min(20, len(week_a.artists), len(week_b.artists))
+    return float(_jaccard_rows(weeks, np.array([a]), np.array([b]))[0])
 
-    if n == 0:
-        return 0.0
 
-    # Extract artist names from top N
-    top_a = set(artist for artist, _ in week_a.artists.most_common(n))
-    top_b = set(artist for artist, _ in week_b.artists.most_common(n))
+def _jaccard_rows(weeks: WeekTable, rows_a: np.ndarray, rows_b: np.ndarray) -> np.ndarray:
+    """Jaccard similarity of top artists for each pair of week rows."""
+    top = weeks.top_artist_ids
+    width = top.shape[1]
+    counts = np.minimum(np.diff(weeks.artist_ptr), width)
 
-    # Calculate Jaccard similarity
-    intersection = len(top_a & top_b)
-    union = len(top_a | top_b)
+    # Compare the same number of top artists from each week
+    n = np.minimum(counts[rows_a], counts[rows_b])
+    keep = np.arange(width) < n[:, None]
 
-    if union == 0:
-        return 0.0
+    # Distinct pads so padding never matches; ids are unique within a row, so
+    # counting equal (i, j) cells counts the intersection
+    top_a = np.where(keep, top[rows_a], -1)
+    top_b = np.where(keep, top[rows_b], -2)
+    intersection = (top_a[:, :, None] == top_b[:, None, :]).sum(axis=(1, 2))
+    union = 2 * n - intersection
 
-    return intersection / union
+    return np.where(union > 0, intersection / np.maximum(union, 1), 0.0)
 
 
-def detect_era_boundaries(weeks: List[WeekBucket], threshold: float = 0.3) -> List[int]:
+def detect_era_boundaries(weeks: WeekTable, threshold: float = 0.3) -> List[int]:
     """
     Detect boundaries between eras based on listening pattern changes.
 
+    Every consecutive pair of weeks is checked at once: a gap in listening or
+    a drop in top-artist similarity starts a new era.
+
     Args:
-        weeks: List of WeekBucket objects sorted by week_start
+        weeks: WeekTable sorted by week start
         threshold: Similarity threshold below which a new era starts (0.0-1.0)
                    Lower = more eras, Higher = fewer eras
 
     Returns:
         List of week indices where new eras start (always includes 0)
     """
-    if not weeks:
+    if not len(weeks):
         return []
 
-    if len(weeks) == 1:
-        return [0]
-
-    boundaries = [0]  # First week is always a boundary
+    # Gap in listening (more than 4 weeks) between consecutive weeks
+    gaps = np.diff(weeks.week_days) > 28
 
-    for i in range(1, len(weeks)):
-        # Check for gap in listening (more than 4 weeks)
-        gap_days = (weeks[i].week_start - weeks[i - 1].week_start).days
-        if gap_days > 28:  # More than 4 weeks gap
-            boundaries.append(i)
-            continue
+    # Similarity of each week with the previous one
+    rows = np.arange(1, len(weeks))
+    similarity = _jaccard_rows(weeks, rows - 1, rows)
 
-        # Check similarity with previous week
-        similarity = calculate_similarity(weeks[i - 1], weeks[i])
-        if similarity < threshold:
-            boundaries.append(i)
+    # First week is always a boundary
+    return [0] + (np.flatnonzero(gaps | (similarity < threshold)) + 1).tolist()
 
-    return boundaries
 
-
-def build_eras(weeks: List[WeekBucket], boundaries: List[int]) -> List[Era]:
+def build_eras(weeks: WeekTable, boundaries: List[int], history: ListeningHistory) -> List[Era]:
     """
     Build Era objects from week buckets and boundaries.
 
     Args:
-        weeks: List of WeekBucket objects sorted by week_start
+        weeks: WeekTable sorted by week start
         boundaries: List of week indices where eras start
+        history: ListeningHistory the weeks were built from (for name lookup)
 
     Returns:
         List of Era objects with sequential IDs starting at 1
     """
-    if not weeks or not boundaries:
+    if not len(weeks) or not boundaries:
         return []
 
     eras = []
+    artists = history.artists
+    tracks = history.tracks
+    n_artists = weeks.n_artists
 
     for i, start_idx in enumerate(boundaries):
         # Determine end index (exclusive)
@@ -149,39 +205,34 @@ def build_eras(weeks: List[WeekBucket], boundaries: List[int]) -> List[Era]:
         else:
             end_idx = len(weeks)
 
-        # Get weeks for this era
-        era_weeks = weeks[start_idx:end_idx]
-        if not era_weeks:
+        if start_idx >= end_idx:
             continue
 
-        # Combine artist counts
-        combined_artists = sum(
-            (week.artists for week in era_weeks),
-            Counter()
-        )
-
-        # Combine track counts
-        combined_tracks = sum(
-            (week.tracks for week in era_weeks),
-            Counter()
-        )
-
-        # Calculate total listening time
-        total_ms = sum(week.total_ms for week in era_weeks)
+        # An era's weeks are contiguous rows, so their counts are one slice
+        a_lo, a_hi = weeks.artist_ptr[start_idx], weeks.artist_ptr[end_idx]
+        t_lo, t_hi = weeks.track_ptr[start_idx], weeks.track_ptr[end_idx]
 
         # Get top 10 artists as List[Tuple[str, int]]
-        top_artists = combined_artists.most_common(10)
+        top_artists = [
+            (artists[artist_id], count)
+            for artist_id, count in _top_keys(
+                weeks.artist_keys[a_lo:a_hi], weeks.artist_counts[a_lo:a_hi], 10
+            )
+        ]
 
         # Get top 20 tracks as List[Tuple[str, str, int]]
-        # Track keys are (track_name, artist_name), values are counts
-        top_tracks = [
-            (track_name, artist_name, count)
-            for (track_name, artist_name), count in combined_tracks.most_common(20)
-        ]
+        # Track keys are track_id * n_artists + artist_id, values are counts
+        top_tracks = []
+        for key, count in _top_keys(weeks.track_keys[t_lo:t_hi], weeks.track_counts[t_lo:t_hi], 20):
+            track_id, artist_id = divmod(key, n_artists)
+            top_tracks.append((tracks[track_id], artists[artist_id], count))
+
+        # Calculate total listening time
+        total_ms = int(weeks.total_ms[start_idx:end_idx].sum())
 
         # Calculate dates
-        start_date = era_weeks[0].week_start
-        end_date = era_weeks[-1].week_start + timedelta(days=6)
+        start_date = weeks.week_starts[start_idx]
+        end_date = weeks.week_starts[end_idx - 1] + timedelta(days=6)
 
         era = Era(
             id=i + 1,  # 1-indexed
@@ -231,18 +282,18 @@ def filter_eras(eras: List[Era], min_weeks: int = 2, min_ms: int = 3600000) -> L
     return filtered
 
 
-def calculate_aggregate_stats(events: List[ListeningEvent]) -> dict:
+def calculate_aggregate_stats(history: ListeningHistory) -> dict:
     """
     Calculate aggregate statistics from listening events.
     Call this before deleting events to preserve stats for API.
 
     Args:
-        events: List of ListeningEvent objects
+        history: ListeningHistory of plays
 
     Returns:
         Dict with total_tracks, total_artists, total_ms, and date_range
     """
-    if not events:
+    if not len(history):
         return {
             "total_tracks": 0,
             "total_artists": 0,
@@ -250,32 +301,38 @@ def calculate_aggregate_stats(events: List[ListeningEvent]) -> dict:
             "date_range": {"start": None, "end": None}
         }
 
-    unique_tracks = set((e.track_name, e.artist_name) for e in events)
-    unique_artists = set(e.artist_name for e in events)
+    # Pack (track_id, artist_id) into one int64 so uniqueness is a 1-D pass
+    n_artists = len(history.artists)
+    track_keys = history.track_ids.astype(np.int64) * n_artists + history.artist_ids
 
     return {
-        "total_tracks": len(unique_tracks),
-        "total_artists": len(unique_artists),
-        "total_ms": sum(e.ms_played for e in events),
+        "total_tracks": int(np.unique(track_keys).size),
+        # Every name in the artist table was interned from a kept play
+        "total_artists": n_artists,
+        "total_ms": int(history.ms_played.sum()),
         "date_range": {
-            "start": min(e.timestamp for e in events).date().isoformat(),
-            "end": max(e.timestamp for e in events).date().isoformat()
+            "start": _utc_date(history.timestamps.min()).isoformat(),
+            "end": _utc_date(history.timestamps.max()).isoformat()
         }
     }
 
 
-def segment_listening_history(events: List[ListeningEvent]) -> List[Era]:
+def _utc_date(ts) -> date:
+    return datetime.fromtimestamp(int(ts), timezone.utc).date()
+
+
+def segment_listening_history(history: ListeningHistory) -> List[Era]:
     """
     Main entry point for era segmentation.
 
     Args:
-        events: List of ListeningEvent objects
+        history: ListeningHistory of plays
 
     Returns:
         List of Era objects (may be empty)
     """
-    weeks = aggregate_by_week(events)
+    weeks = aggregate_by_week(history)
     boundaries = detect_era_boundaries(weeks)
-    eras = build_eras(weeks, boundaries)
+    eras = build_eras(weeks, boundaries, history)
     filtered = filter_eras(eras)
     return filtered
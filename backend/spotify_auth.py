@@ -6,11 +6,17 @@ Handles login, callback, and token management
 import os
 import base64
 import secrets
+import orjson
 import requests
+import threading
 import time
+from collections import deque
 from urllib.parse import urlencode
 from flask import redirect, request, jsonify, session
+from cachetools import TTLCache
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 load_dotenv()
 
@@ -19,10 +25,62 @@ SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
 SPOTIFY_REDIRECT_URI = os.getenv('SPOTIFY_REDIRECT_URI')
 
+# Where the OAuth routes send the browser back to
+FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:8000')
+FRONTEND_LOGIN_OK_URL = f'{FRONTEND_URL}/?logged_in=true'
+
 SPOTIFY_AUTH_URL = 'https://accounts.spotify.com/authorize'
 SPOTIFY_TOKEN_URL = 'https://accounts.spotify.com/api/token'
 SPOTIFY_API_BASE = 'https://api.spotify.com/v1'
 
+# Client credentials never change while the process runs, so the token
+# endpoint headers are built once
+TOKEN_REQUEST_HEADERS = {
+    'Authorization': 'Basic ' + base64.b64encode(
+        f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()
+    ).decode(),
+    'Content-Type': 'application/x-www-form-urlencoded'
+}
+
+# Shared HTTP session for every Spotify call (auth and API). Keep-alive
+# connections are reused across requests, skipping a TCP+TLS handshake per
+# call. Retry only replays idempotent methods (not the token or playlist
+# POSTs), and hands back the last response instead of raising, so callers
+# keep checking status_code as before. 429s are left to spotify_get/post.
+spotify_http = requests.Session()
+spotify_http.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[500, 502, 503, 504],
+        raise_on_status=False
+    )
+))
+
+# Process-wide cap on Spotify calls, kept under Spotify's rolling 30s window
+SPOTIFY_RATE_LIMIT_CALLS = 90
+SPOTIFY_RATE_LIMIT_PERIOD = 30  # seconds
+
+# Rate-limited (429) calls are retried this many times after Retry-After,
+# unless Spotify asks for a longer wait than we'll hold a worker for
+SPOTIFY_429_RETRIES = 3
+SPOTIFY_MAX_RETRY_AFTER = 10  # seconds
+
+# Access tokens are refreshed once they are this close to expiring
+TOKEN_REFRESH_MARGIN = 300  # seconds
+
+# /auth/me answers from the profile cached in the session for this long
+PROFILE_CACHE_TTL = 300  # seconds
+
+# Last ETag and parsed body per (Authorization, url, params), so repeat GETs
+# of rarely-changing resources are revalidated instead of re-downloaded.
+# Keyed by the bearer token, so one user's body is never served to another
+ETAG_CACHE_TTL = 3600  # seconds (access tokens rotate hourly anyway)
+_etag_cache = TTLCache(maxsize=4096, ttl=ETAG_CACHE_TTL)
+_etag_cache_lock = threading.Lock()
+
 # Required scopes for TasteSwipe
 SCOPES = [
     'user-top-read',           # Read user's top artists/tracks
@@ -31,71 +89,118 @@ SCOPES = [
     'playlist-modify-private'  # Create/modify private playlists
 ]
 
+# Everything in the authorize URL except the per-login state is fixed
+AUTH_URL_PREFIX = f"{SPOTIFY_AUTH_URL}?" + urlencode({
+    'client_id': SPOTIFY_CLIENT_ID,
+    'response_type': 'code',
+    'redirect_uri': SPOTIFY_REDIRECT_URI,
+    'scope': ' '.join(SCOPES),
+    'show_dialog': False
+})
+
+
+class RateLimiter:
+    """Blocks callers so at most max_calls start in any period seconds"""
+
+    def __init__(self, max_calls, period):
+        self.max_calls = max_calls
+        self.period = period
+        self._starts = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Waiters queue on the lock, so they are released in arrival order
+        with self._lock:
+            now = time.monotonic()
+            while self._starts and now - self._starts[0] >= self.period:
+                self._starts.popleft()
+
+            if len(self._starts) >= self.max_calls:
+                time.sleep(self.period - (now - self._starts.popleft()))
+                now = time.monotonic()
+
+            self._starts.append(now)
+
+
+spotify_rate_limiter = RateLimiter(SPOTIFY_RATE_LIMIT_CALLS, SPOTIFY_RATE_LIMIT_PERIOD)
+
+
+def retry_after_seconds(response):
+    """Seconds a 429 response asks us to wait (Retry-After), default 1"""
+    try:
+        return max(int(response.headers.get('Retry-After', 1)), 0)
+    except (TypeError, ValueError):
+        return 1
+
+
+def _send_throttled(send, url, **kwargs):
+    """
+    Send a Spotify request through the rate limiter, retrying 429s
+
+    A 429 means Spotify did not process the request, so POSTs are safe to
+    retry here too. The 429 response is returned as-is once retries run out
+    or Retry-After exceeds SPOTIFY_MAX_RETRY_AFTER.
+    """
+    for attempt in range(SPOTIFY_429_RETRIES + 1):
+        spotify_rate_limiter.acquire()
+        response = send(url, **kwargs)
+        if response.status_code != 429 or attempt == SPOTIFY_429_RETRIES:
+            return response
+
+        delay = retry_after_seconds(response)
+        if delay > SPOTIFY_MAX_RETRY_AFTER:
+            return response
+        time.sleep(delay)
+
+    return response
+
+
+def spotify_get(url, **kwargs):
+    """GET through the shared session, rate limited and 429-aware"""
+    return _send_throttled(spotify_http.get, url, **kwargs)
+
+
+def spotify_post(url, **kwargs):
+    """POST through the shared session, rate limited and 429-aware"""
+    return _send_throttled(spotify_http.post, url, **kwargs)
+
 
 def get_auth_url():
     """Generate Spotify authorization URL"""
+    # token_urlsafe output never needs percent-encoding
     state = secrets.token_urlsafe(16)
-    
-    params = {
-        'client_id': SPOTIFY_CLIENT_ID,
-        'response_type': 'code',
-        'redirect_uri': SPOTIFY_REDIRECT_URI,
-        'scope': ' '.join(SCOPES),
-        'state': state,
-        'show_dialog': False
-    }
-    
-    auth_url = f"{SPOTIFY_AUTH_URL}?{urlencode(params)}"
-    return auth_url, state
+    return f"{AUTH_URL_PREFIX}&state={state}", state
 
 
 def exchange_code_for_token(code):
     """Exchange authorization code for access token"""
-    auth_header = base64.b64encode(
-        f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()
-    ).decode()
-    
-    headers = {
-        'Authorization': f'Basic {auth_header}',
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    
     data = {
         'grant_type': 'authorization_code',
         'code': code,
         'redirect_uri': SPOTIFY_REDIRECT_URI
     }
     
-    response = requests.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
+    response = spotify_post(SPOTIFY_TOKEN_URL, headers=TOKEN_REQUEST_HEADERS, data=data)
     
     if response.status_code != 200:
         raise Exception(f"Token exchange failed: {response.text}")
     
-    return response.json()
+    return orjson.loads(response.content)
 
 
 def refresh_access_token(refresh_token):
     """Request a new access token using refresh token"""
-    auth_header = base64.b64encode(
-        f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()
-    ).decode()
-    
-    headers = {
-        'Authorization': f'Basic {auth_header}',
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    
     data = {
         'grant_type': 'refresh_token',
         'refresh_token': refresh_token
     }
     
-    response = requests.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
+    response = spotify_post(SPOTIFY_TOKEN_URL, headers=TOKEN_REQUEST_HEADERS, data=data)
     
     if response.status_code != 200:
         raise Exception(f"Token refresh failed: {response.text}")
     
-    return response.json()
+    return orjson.loads(response.content)
 
 
 def get_valid_token():
@@ -107,9 +212,10 @@ def get_valid_token():
     if not access_token or not refresh_token:
         return None
         
-    # Check if token is expired or about to expire (within 5 minutes)
-    # expires_at should be a timestamp
-    if expires_at and time.time() > (expires_at - 300):
+    # Check if token is expired or about to expire (within the margin).
+    # expires_at is an absolute timestamp set at login/refresh, so this
+    # refreshes once per token lifetime, not per call
+    if expires_at and time.time() > (expires_at - TOKEN_REFRESH_MARGIN):
         try:
             token_data = refresh_access_token(refresh_token)
             
@@ -131,15 +237,63 @@ def get_valid_token():
     return access_token
 
 
+def etag_lookup(url, headers, params=None):
+    """
+    Find the cached (etag, body) for this user and resource
+
+    Returns (key, cached, request_headers); request_headers adds
+    If-None-Match when there is a cached entry, and cached is None otherwise.
+    """
+    key = (headers.get('Authorization'), url, tuple(sorted(params.items())) if params else ())
+    with _etag_cache_lock:
+        cached = _etag_cache.get(key)
+    if cached is None:
+        return key, None, headers
+    return key, cached, {**headers, 'If-None-Match': cached[0]}
+
+
+def etag_store(key, response, body):
+    """Remember a 200 response's parsed body under its ETag, if it has one"""
+    etag = response.headers.get('ETag')
+    if etag:
+        with _etag_cache_lock:
+            _etag_cache[key] = (etag, body)
+
+
 def get_user_profile(access_token):
-    """Get current user's profile"""
-    headers = {'Authorization': f'Bearer {access_token}'}
-    response = requests.get(f"{SPOTIFY_API_BASE}/me", headers=headers)
+    """Get current user's profile (revalidated with its ETag)"""
+    url = f"{SPOTIFY_API_BASE}/me"
+    key, cached, headers = etag_lookup(url, {'Authorization': f'Bearer {access_token}'})
+    response = spotify_get(url, headers=headers)
     
+    if response.status_code == 304 and cached is not None:
+        return cached[1]
     if response.status_code != 200:
         raise Exception(f"Failed to get user profile: {response.text}")
     
-    return response.json()
+    profile = orjson.loads(response.content)
+    etag_store(key, response, profile)
+    return profile
+
+
+def summarize_profile(profile):
+    """Project a Spotify profile to the fields /auth/me returns"""
+    return {
+        'id': profile['id'],
+        'display_name': profile.get('display_name'),
+        'email': profile.get('email'),
+        'image': profile.get('images', [{}])[0].get('url') if profile.get('images') else None
+    }
+
+
+def cache_profile(profile):
+    """
+    Keep the /auth/me projection in the session (not the full profile:
+    the session lives in a size-limited cookie). Returns the projection.
+    """
+    user = summarize_profile(profile)
+    session['profile_cache'] = {'user': user, 'cached_at': time.time()}
+    return user
 
 
 # Flask route handlers (to be imported in app.py)
@@ -182,14 +336,13 @@ def init_spotify_routes(app):
             user_profile = get_user_profile(token_data['access_token'])
             session['user_id'] = user_profile['id']
             session['display_name'] = user_profile.get('display_name', 'User')
+            cache_profile(user_profile)
             
             # Redirect back to frontend (not backend!)
-            frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:8000')
-            return redirect(f'{frontend_url}/?logged_in=true')
+            return redirect(FRONTEND_LOGIN_OK_URL)
             
         except Exception as e:
-            frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:8000')
-            return redirect(f'{frontend_url}/?error=auth_failed&message={str(e)}')
+            return redirect(f'{FRONTEND_URL}/?error=auth_failed&message={str(e)}')
     
     @app.route('/auth/me')
     def get_current_user():
@@ -198,17 +351,14 @@ def init_spotify_routes(app):
         if not access_token:
             return jsonify({'logged_in': False}), 401
         
+        # The profile rarely changes; skip the Spotify round trip while fresh
+        cached = session.get('profile_cache')
+        if cached and time.time() - cached['cached_at'] < PROFILE_CACHE_TTL:
+            return jsonify({'logged_in': True, 'user': cached['user']})
+        
         try:
             profile = get_user_profile(access_token)
-            return jsonify({
-                'logged_in': True,
-                'user': {
-                    'id': profile['id'],
-                    'display_name': profile.get('display_name'),
-                    'email': profile.get('email'),
-                    'image': profile.get('images', [{}])[0].get('url') if profile.get('images') else None
-                }
-            })
+            return jsonify({'logged_in': True, 'user': cache_profile(profile)})
         except Exception as e:
             return jsonify({'error': str(e)}), 401
     
@@ -216,5 +366,4 @@ def init_spotify_routes(app):
     def logout():
         """Clear session and logout"""
         session.clear()
-        frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:8000')
-        return redirect(frontend_url)
+        return redirect(FRONTEND_URL)
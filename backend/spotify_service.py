@@ -3,57 +3,116 @@ Spotify API Service
 Handles recommendations, playlists, and user data
 """
 
-import requests
-from flask import session
-from spotify_auth import get_valid_token
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import lru_cache
+from itertools import islice
+
+import orjson
+from cachetools import TTLCache
+from flask import g, session
+from spotify_auth import etag_lookup, etag_store, get_valid_token, spotify_get, spotify_post
 
 SPOTIFY_API_BASE = 'https://api.spotify.com/v1'
 
+# Max URIs per "add items to playlist" request (Spotify API limit)
+PLAYLIST_ADD_CHUNK_SIZE = 100
+
+# Recommendation seeds per (user_id, time_range), see get_top_seeds
+SEED_CACHE_TTL = 600  # seconds
+_seed_cache = TTLCache(maxsize=1024, ttl=SEED_CACHE_TTL)
+_seed_cache_lock = threading.Lock()
+
 
 def get_spotify_headers():
-    """Get auth headers with access token"""
+    """
+    Get auth headers with access token
+
+    Memoized on flask.g, so the token is checked (and refreshed if needed)
+    once per request however many Spotify calls the request makes.
+    """
+    headers = g.get('spotify_headers')
+    if headers is not None:
+        return headers
+
     access_token = get_valid_token()
     if not access_token:
         raise Exception('Not authenticated')
     
-    return {'Authorization': f'Bearer {access_token}'}
+    g.spotify_headers = headers = {'Authorization': f'Bearer {access_token}'}
+    return headers
 
 
-def get_user_top_artists(limit=5, time_range='medium_term'):
+def _get_top_items(kind, headers, limit=5, time_range='medium_term'):
     """
-    Get user's top artists
-    time_range: short_term (4 weeks), medium_term (6 months), long_term (years)
+    Get the user's top artists or tracks (kind is 'artists' or 'tracks')
+
+    Takes the auth headers instead of reading flask.session, so it can run on
+    a worker thread. Repeat requests are revalidated with the last ETag.
     """
-    headers = get_spotify_headers()
+    url = f"{SPOTIFY_API_BASE}/me/top/{kind}"
     params = {'limit': limit, 'time_range': time_range}
-    
-    response = requests.get(
-        f"{SPOTIFY_API_BASE}/me/top/artists",
-        headers=headers,
+    key, cached, request_headers = etag_lookup(url, headers, params)
+
+    response = spotify_get(
+        url,
+        headers=request_headers,
         params=params
     )
-    
+
+    if response.status_code == 304 and cached is not None:
+        return cached[1]['items']
     if response.status_code != 200:
-        raise Exception(f"Failed to get top artists: {response.text}")
-    
-    return response.json()['items']
+        raise Exception(f"Failed to get top {kind}: {response.text}")
+
+    body = orjson.loads(response.content)
+    etag_store(key, response, body)
+    return body['items']
+
+
+def get_user_top_artists(limit=5, time_range='medium_term'):
+    """
+    Get user's top artists
+    time_range: short_term (4 weeks), medium_term (6 months), long_term (years)
+    """
+    return _get_top_items('artists', get_spotify_headers(), limit, time_range)
 
 
 def get_user_top_tracks(limit=5, time_range='medium_term'):
     """Get user's top tracks"""
-    headers = get_spotify_headers()
-    params = {'limit': limit, 'time_range': time_range}
-    
-    response = requests.get(
-        f"{SPOTIFY_API_BASE}/me/top/tracks",
-        headers=headers,
-        params=params
-    )
-    
-    if response.status_code != 200:
-        raise Exception(f"Failed to get top tracks: {response.text}")
-    
-    return response.json()['items']
+    return _get_top_items('tracks', get_spotify_headers(), limit, time_range)
+
+
+def get_top_seeds(headers, time_range='medium_term'):
+    """
+    Get (seed_artists, seed_tracks) ids from the user's top artists/tracks
+
+    Cached per user for SEED_CACHE_TTL: a swipe session asks for
+    recommendations many times and the seeds barely move.
+    """
+    key = (session.get('user_id'), time_range)
+    if key[0] is not None:
+        with _seed_cache_lock:
+            seeds = _seed_cache.get(key)
+        if seeds is not None:
+            return seeds
+
+    # The two lookups are independent, so run them concurrently:
+    # one round trip instead of two on the cold path
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        top_artists = executor.submit(_get_top_items, 'artists', headers, 3, time_range)
+        top_tracks = executor.submit(_get_top_items, 'tracks', headers, 2, time_range)
+
+        seeds = (
+            [artist['id'] for artist in top_artists.result()],
+            [track['id'] for track in top_tracks.result()]
+        )
+
+    if key[0] is not None:
+        with _seed_cache_lock:
+            _seed_cache[key] = seeds
+    return seeds
 
 
 def get_recommendations(seed_artists=None, seed_tracks=None, limit=10):
@@ -65,25 +124,19 @@ def get_recommendations(seed_artists=None, seed_tracks=None, limit=10):
     # If no seeds provided, use user's top artists/tracks
     if not seed_artists and not seed_tracks:
         try:
-            top_artists = get_user_top_artists(limit=3)
-            top_tracks = get_user_top_tracks(limit=2)
-            
-            seed_artists = [artist['id'] for artist in top_artists]
-            seed_tracks = [track['id'] for track in top_tracks]
+            seed_artists, seed_tracks = get_top_seeds(headers)
         except:
             # Fallback to popular seed if user has no history
             seed_artists = ['06HL4z0CvFAxyc27GXpf02']  # Taylor Swift as fallback
     
-    params = {
-        'limit': limit,
-        'seed_artists': ','.join(seed_artists[:5]) if seed_artists else None,
-        'seed_tracks': ','.join(seed_tracks[:5]) if seed_tracks else None
-    }
-    
-    # Remove None values
-    params = {k: v for k, v in params.items() if v is not None}
+    # Spotify takes up to 5 seeds of each kind; omit a kind with no seeds
+    params = {'limit': limit}
+    if seed_artists:
+        params['seed_artists'] = ','.join(islice(seed_artists, 5))
+    if seed_tracks:
+        params['seed_tracks'] = ','.join(islice(seed_tracks, 5))
     
-    response = requests.get(
+    response = spotify_get(
         f"{SPOTIFY_API_BASE}/recommendations",
         headers=headers,
         params=params
@@ -92,13 +145,12 @@ def get_recommendations(seed_artists=None, seed_tracks=None, limit=10):
     if response.status_code != 200:
         raise Exception(f"Failed to get recommendations: {response.text}")
     
-    return response.json()['tracks']
+    return orjson.loads(response.content)['tracks']
 
 
 def create_playlist(name, description, public=True):
     """Create a new playlist for the user"""
-    headers = get_spotify_headers()
-    headers['Content-Type'] = 'application/json'
+    headers = {**get_spotify_headers(), 'Content-Type': 'application/json'}
     
     user_id = session.get('user_id')
     if not user_id:
@@ -110,7 +162,7 @@ def create_playlist(name, description, public=True):
         'public': public
     }
     
-    response = requests.post(
+    response = spotify_post(
         f"{SPOTIFY_API_BASE}/users/{user_id}/playlists",
         headers=headers,
         json=data
@@ -119,36 +171,45 @@ def create_playlist(name, description, public=True):
     if response.status_code not in [200, 201]:
         raise Exception(f"Failed to create playlist: {response.text}")
     
-    return response.json()
+    return orjson.loads(response.content)
 
 
 def add_tracks_to_playlist(playlist_id, track_uris):
-    """Add tracks to a playlist"""
-    headers = get_spotify_headers()
-    headers['Content-Type'] = 'application/json'
-    
-    data = {'uris': track_uris}
-    
-    response = requests.post(
-        f"{SPOTIFY_API_BASE}/playlists/{playlist_id}/tracks",
-        headers=headers,
-        json=data
-    )
-    
-    if response.status_code not in [200, 201]:
-        raise Exception(f"Failed to add tracks: {response.text}")
-    
-    return response.json()
+    """
+    Add tracks to a playlist
+
+    Spotify accepts at most 100 URIs per request, so longer lists are sent in
+    order, in chunks, over the shared keep-alive session.
+    """
+    headers = {**get_spotify_headers(), 'Content-Type': 'application/json'}
+    url = f"{SPOTIFY_API_BASE}/playlists/{playlist_id}/tracks"
+
+    result = None
+    for start in range(0, len(track_uris), PLAYLIST_ADD_CHUNK_SIZE):
+        data = {'uris': track_uris[start:start + PLAYLIST_ADD_CHUNK_SIZE]}
+
+        response = spotify_post(url, headers=headers, json=data)
+
+        if response.status_code not in [200, 201]:
+            raise Exception(f"Failed to add tracks: {response.text}")
+
+        result = orjson.loads(response.content)
+
+    return result
+
+
+@lru_cache(maxsize=1)
+def _today_str(day_ordinal):
+    """Format a day (as a date ordinal) for playlist names; cached for the day"""
+    return date.fromordinal(day_ordinal).strftime('%B %d, %Y')
 
 
 def create_daylist_playlist(liked_tracks):
     """
     Create a TasteSwipe daylist playlist from liked tracks
     """
-    from datetime import datetime
-    
     # Generate playlist name with date
-    date_str = datetime.now().strftime('%B %d, %Y')
+    date_str = _today_str(date.today().toordinal())
     playlist_name = f"TasteSwipe Daylist - {date_str}"
     playlist_description = f"My daily music discoveries from TasteSwipe • {len(liked_tracks)} songs I loved"
     
@@ -156,7 +217,7 @@ def create_daylist_playlist(liked_tracks):
     playlist = create_playlist(playlist_name, playlist_description, public=False)
     
     # Add tracks
-    track_uris = [track['uri'] for track in liked_tracks if track.get('uri')]
+    track_uris = [uri for track in liked_tracks if (uri := track.get('uri'))]
     if track_uris:
         add_tracks_to_playlist(playlist['id'], track_uris)
     
@@ -3,11 +3,38 @@ Unit Tests for TasteSwipe Backend
 Tests for Spotify Auth, AI Service, and API endpoints
 """
 
+import io
+import os
+import zipfile
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 import json
 from datetime import datetime
 
+# Tests that go through the Flask app share its in-memory session store,
+# limiter and caches, so under pytest-xdist they all run on one worker
+app_state = pytest.mark.xdist_group(name='app_state')
+
+
+@pytest.fixture(scope='session')
+def app():
+    """Import the Flask app once for the whole run"""
+    from backend.app import app, limiter
+    app.config['TESTING'] = True
+    # Many tests upload from the same client address; route limits would
+    # make them depend on how many ran in the last minute
+    limiter.enabled = False
+    return app
+
+
+@pytest.fixture
+def app_ctx(app):
+    """Run the test inside an app and request context"""
+    with app.app_context():
+        with app.test_request_context():
+            yield
+
+
 # Test Spotify Auth Module
 class TestSpotifyAuth:
     """Test Spotify OAuth authentication functions"""
@@ -24,7 +51,7 @@ class TestSpotifyAuth:
         assert 'scope=' in auth_url
         assert len(state) > 10  # State should be a random token
     
-    @patch('backend.spotify_auth.requests.post')
+    @patch('backend.spotify_auth.spotify_http.post')
     def test_exchange_code_for_token_success(self, mock_post):
         """Test successful token exchange"""
         from backend.spotify_auth import exchange_code_for_token
@@ -32,11 +59,11 @@ class TestSpotifyAuth:
         # Mock successful response
         mock_response = Mock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {
+        mock_response.content = json.dumps({
             'access_token': 'test_access_token',
             'refresh_token': 'test_refresh_token',
             'expires_in': 3600
-        }
+        }).encode()
         mock_post.return_value = mock_response
         
         result = exchange_code_for_token('test_code')
@@ -45,7 +72,7 @@ class TestSpotifyAuth:
         assert result['refresh_token'] == 'test_refresh_token'
         assert result['expires_in'] == 3600
     
-    @patch('backend.spotify_auth.requests.post')
+    @patch('backend.spotify_auth.spotify_http.post')
     def test_exchange_code_for_token_failure(self, mock_post):
         """Test token exchange failure handling"""
         from backend.spotify_auth import exchange_code_for_token
@@ -59,19 +86,19 @@ class TestSpotifyAuth:
         with pytest.raises(Exception, match='Token exchange failed'):
             exchange_code_for_token('invalid_code')
     
-    @patch('backend.spotify_auth.requests.get')
+    @patch('backend.spotify_auth.spotify_http.get')
     def test_get_user_profile_success(self, mock_get):
         """Test getting user profile"""
         from backend.spotify_auth import get_user_profile
         
         mock_response = Mock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {
+        mock_response.content = json.dumps({
             'id': 'user123',
             'display_name': 'Test User',
             'email': 'test@example.com',
             'images': [{'url': 'http://example.com/avatar.jpg'}]
-        }
+        }).encode()
         mock_get.return_value = mock_response
         
         result = get_user_profile('test_token')
@@ -79,6 +106,28 @@ class TestSpotifyAuth:
         assert result['id'] == 'user123'
         assert result['display_name'] == 'Test User'
 
+    @patch('backend.spotify_auth.spotify_http.get')
+    def test_get_user_profile_not_modified(self, mock_get):
+        """Test a 304 revalidation returns the cached profile"""
+        from backend.spotify_auth import get_user_profile
+
+        fresh = Mock()
+        fresh.status_code = 200
+        fresh.headers = {'ETag': '"profile-v1"'}
+        fresh.content = json.dumps({'id': 'etag_user', 'display_name': 'Cached'}).encode()
+        not_modified = Mock()
+        not_modified.status_code = 304
+        not_modified.headers = {}
+        not_modified.content = b''
+        mock_get.side_effect = [fresh, not_modified]
+
+        first = get_user_profile('etag_profile_token')
+        second = get_user_profile('etag_profile_token')
+
+        assert second == first == {'id': 'etag_user', 'display_name': 'Cached'}
+        assert 'If-None-Match' not in mock_get.call_args_list[0].kwargs['headers']
+        assert mock_get.call_args_list[1].kwargs['headers']['If-None-Match'] == '"profile-v1"'
+
 
 # Test AI Service Module
 class TestAIService:
@@ -138,6 +187,47 @@ class TestAIService:
         assert isinstance(result, str)
         assert len(result) > 0
     
+    @patch('backend.ai_service.client.chat.completions.create')
+    def test_analyze_music_taste_cached_by_prompt(self, mock_openai):
+        """Test identical swipes reuse the analysis and different swipes do not"""
+        from backend.ai_service import analyze_music_taste
+
+        mock_completion = Mock()
+        mock_completion.choices = [Mock()]
+        mock_completion.choices[0].message.content = json.dumps({
+            'summary': 'Cached taste', 'vibe': 'mellow', 'mood': 'calm'
+        })
+        mock_openai.return_value = mock_completion
+
+        liked = [{'track': 'Cache Song', 'artist': 'Cache Artist'}]
+        first = analyze_music_taste(liked, [])
+        second = analyze_music_taste(liked, [])
+
+        assert first == second
+        assert mock_openai.call_count == 1
+
+        other = [{'track': 'Other Song', 'artist': 'Other Artist'}]
+        analyze_music_taste(other, [])
+        assert mock_openai.call_count == 2
+
+    @patch('backend.ai_service.client.chat.completions.create')
+    def test_generate_playlist_name_failure_not_cached(self, mock_openai):
+        """Test a failed naming call is retried rather than served from cache"""
+        from backend.ai_service import generate_playlist_name
+
+        mock_completion = Mock()
+        mock_completion.choices = [Mock()]
+        mock_completion.choices[0].message.content = 'Uncached Name'
+        mock_openai.side_effect = [Exception('API down'), mock_completion]
+
+        liked = [{'track': 'Retry Song', 'artist': 'Retry Artist'}]
+        fallback = generate_playlist_name(liked)
+        named = generate_playlist_name(liked)
+
+        assert named == 'Uncached Name'
+        assert fallback != named
+        assert mock_openai.call_count == 2
+
     def test_detect_session_mood_open_minded(self):
         """Test mood detection for open-minded users"""
         from backend.ai_service import detect_session_mood
@@ -164,70 +254,268 @@ class TestAIService:
         assert result['mood'] == 'selective'
 
 
+# Test LLM Era Naming
+class TestLLMService:
+    """Test era naming and its response cache"""
+
+    @staticmethod
+    def make_era(artist):
+        from datetime import date
+        from backend.models import Era
+        return Era(
+            id=1,
+            start_date=date(2024, 1, 1),
+            end_date=date(2024, 2, 29),
+            top_artists=[(artist, 40)],
+            top_tracks=[('Song', artist, 20)],
+            total_ms_played=36000000,
+        )
+
+    def test_era_name_cache(self, tmp_path):
+        """Test a cached prompt skips the LLM and a new prompt does not"""
+        import asyncio
+        from unittest.mock import AsyncMock
+        from backend import llm_service
+
+        named = '{"title": "Late Night Drives", "summary": "Synths for empty roads."}'
+        with patch.object(llm_service, 'LLM_CACHE_PATH', str(tmp_path / 'names.db')), \
+                patch.object(llm_service, '_cache_conn', None), \
+                patch.object(llm_service, 'call_llm_async', AsyncMock(return_value=named)) as mock_llm:
+            try:
+                first = asyncio.run(llm_service.name_era_async(object(), self.make_era('Artist A')))
+                second = asyncio.run(llm_service.name_era_async(object(), self.make_era('Artist A')))
+                assert mock_llm.await_count == 1
+
+                other = asyncio.run(llm_service.name_era_async(object(), self.make_era('Artist B')))
+                assert mock_llm.await_count == 2
+            finally:
+                if llm_service._cache_conn is not None:
+                    llm_service._cache_conn.close()
+
+        expected = {'title': 'Late Night Drives', 'summary': 'Synths for empty roads.'}
+        assert first == second == other == expected
+
+    def test_era_name_fallback_not_cached(self, tmp_path):
+        """Test an unparseable response falls back and is not cached"""
+        import asyncio
+        from unittest.mock import AsyncMock
+        from backend import llm_service
+
+        era = self.make_era('Artist C')
+        with patch.object(llm_service, 'LLM_CACHE_PATH', str(tmp_path / 'names.db')), \
+                patch.object(llm_service, '_cache_conn', None), \
+                patch.object(llm_service, 'call_llm_async', AsyncMock(return_value='no json here')):
+            try:
+                result = asyncio.run(llm_service.name_era_async(object(), era))
+                assert llm_service.get_cached_name(llm_service.build_era_prompt(era)) is None
+            finally:
+                if llm_service._cache_conn is not None:
+                    llm_service._cache_conn.close()
+
+        assert result == llm_service.get_fallback_response(era)
+
+    def test_append_delta_brace_inside_string(self):
+        """Test a } inside a string value does not end the stream early"""
+        from backend.llm_service import _append_delta
+
+        parts = []
+        assert _append_delta(parts, '{"title": "Curly } Days",') is False
+        assert _append_delta(parts, ' "summary": "Braces {everywhere}') is False
+        assert _append_delta(parts, '."}') is True
+        assert ''.join(parts) == '{"title": "Curly } Days", "summary": "Braces {everywhere}."}'
+
+    def test_append_delta_split_deltas(self):
+        """Test an object split over many deltas completes on the last one"""
+        from backend.llm_service import _append_delta
+
+        text = '{"title": "Slow Stream", "summary": "One token at a time."}'
+        parts = []
+        done = [_append_delta(parts, ch) for ch in text]
+
+        assert done == [False] * (len(text) - 1) + [True]
+        assert ''.join(parts) == text
+        # Empty and missing deltas are ignored
+        assert _append_delta(parts, '') is False
+        assert _append_delta(parts, None) is False
+        assert ''.join(parts) == text
+
+    def test_append_delta_trailing_prose(self):
+        """Test prose around the object still stops at the closing brace"""
+        from backend.llm_service import _append_delta, parse_llm_response
+
+        parts = []
+        assert _append_delta(parts, 'Sure! Here you go: {"title": "Wrapped",') is False
+        assert _append_delta(parts, ' "summary": "Prose on both sides."} Enjoy!') is True
+        assert parse_llm_response(''.join(parts)) == {
+            'title': 'Wrapped', 'summary': 'Prose on both sides.'
+        }
+
+    def test_append_delta_incomplete_object(self):
+        """Test a closed object missing a key does not stop the stream"""
+        from backend.llm_service import _append_delta
+
+        parts = []
+        assert _append_delta(parts, '{"title": "Only a title"}') is False
+
+
 # Test Spotify Service Module  
 class TestSpotifyService:
     """Test Spotify API service functions"""
     
-    @patch('backend.spotify_service.requests.get')
-    def test_get_user_top_artists(self, mock_get):
+    @patch('backend.spotify_service.spotify_get')
+    def test_get_user_top_artists(self, mock_get, app_ctx):
         """Test fetching user's top artists"""
         from backend.spotify_service import get_user_top_artists
+        from flask import session
         
-        # Create test context
-        from backend.app import app
-        with app.app_context():
-            with app.test_request_context():
-                from flask import session
-                session['access_token'] = 'test_token'
-                session['refresh_token'] = 'test_refresh_token'
-                
-                mock_response = Mock()
-                mock_response.status_code = 200
-                mock_response.json.return_value = {
-                    'items': [
-                        {'id': '1', 'name': 'Artist 1'},
-                        {'id': '2', 'name': 'Artist 2'}
-                    ]
-                }
-                mock_get.return_value = mock_response
-                
-                result = get_user_top_artists(limit=2)
-                
-                assert len(result) == 2
-                assert result[0]['name'] == 'Artist 1'
+        session['access_token'] = 'test_token'
+        session['refresh_token'] = 'test_refresh_token'
+        
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.content = json.dumps({
+            'items': [
+                {'id': '1', 'name': 'Artist 1'},
+                {'id': '2', 'name': 'Artist 2'}
+            ]
+        }).encode()
+        mock_get.return_value = mock_response
+        
+        result = get_user_top_artists(limit=2)
+        
+        assert len(result) == 2
+        assert result[0]['name'] == 'Artist 1'
     
-    @patch('backend.spotify_service.requests.get')
-    def test_get_recommendations(self, mock_get):
+    @patch('backend.spotify_service.spotify_get')
+    def test_get_recommendations(self, mock_get, app_ctx):
         """Test getting song recommendations"""
         from backend.spotify_service import get_recommendations
-        from backend.app import app
-        
-        with app.app_context():
-            with app.test_request_context():
-                from flask import session
-                session['access_token'] = 'test_token'
-                session['refresh_token'] = 'test_refresh_token'
-                
-                mock_response = Mock()
-                mock_response.status_code = 200
-                mock_response.json.return_value = {
-                    'tracks': [
-                        {
-                            'id': '1',
-                            'name': 'Track 1',
-                            'artists': [{'name': 'Artist 1'}],
-                            'uri': 'spotify:track:1',
-                            'album': {'images': [{'url': 'img.jpg'}]}
-                        }
-                    ]
+        from flask import session
+        
+        session['access_token'] = 'test_token'
+        session['refresh_token'] = 'test_refresh_token'
+        
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.content = json.dumps({
+            'tracks': [
+                {
+                    'id': '1',
+                    'name': 'Track 1',
+                    'artists': [{'name': 'Artist 1'}],
+                    'uri': 'spotify:track:1',
+                    'album': {'images': [{'url': 'img.jpg'}]}
                 }
-                mock_get.return_value = mock_response
-                
-                result = get_recommendations(limit=1)
-                
-                assert len(result) == 1
-                assert result[0]['name'] == 'Track 1'
-    
+            ]
+        }).encode()
+        mock_get.return_value = mock_response
+        
+        result = get_recommendations(limit=1)
+        
+        assert len(result) == 1
+        assert result[0]['name'] == 'Track 1'
+
+    @patch('backend.spotify_service.spotify_get')
+    def test_get_top_items_not_modified(self, mock_get):
+        """Test top items are revalidated with If-None-Match and reused on 304"""
+        from backend.spotify_service import _get_top_items
+
+        fresh = Mock()
+        fresh.status_code = 200
+        fresh.headers = {'ETag': '"top-v1"'}
+        fresh.content = json.dumps({'items': [{'id': 'a1', 'name': 'Artist 1'}]}).encode()
+        not_modified = Mock()
+        not_modified.status_code = 304
+        not_modified.headers = {}
+        not_modified.content = b''
+        mock_get.side_effect = [fresh, not_modified]
+
+        headers = {'Authorization': 'Bearer etag_top_token'}
+        first = _get_top_items('artists', headers, limit=1)
+        second = _get_top_items('artists', headers, limit=1)
+
+        assert second == first == [{'id': 'a1', 'name': 'Artist 1'}]
+        assert 'If-None-Match' not in mock_get.call_args_list[0].kwargs['headers']
+        assert mock_get.call_args_list[1].kwargs['headers']['If-None-Match'] == '"top-v1"'
+        # The caller's headers are not modified by the revalidation
+        assert headers == {'Authorization': 'Bearer etag_top_token'}
+
+    @patch('backend.spotify_service.get_valid_token')
+    def test_spotify_headers_memoized_per_request(self, mock_token, app):
+        """Test the token is checked once per request, not once per call"""
+        from backend.spotify_service import get_spotify_headers
+
+        mock_token.side_effect = ['token_a', 'token_b']
+
+        with app.test_request_context():
+            first = get_spotify_headers()
+            second = get_spotify_headers()
+        assert first == second == {'Authorization': 'Bearer token_a'}
+        assert mock_token.call_count == 1
+
+        # A new request does not reuse the previous request's token
+        with app.test_request_context():
+            assert get_spotify_headers() == {'Authorization': 'Bearer token_b'}
+        assert mock_token.call_count == 2
+
+    @patch('backend.spotify_service._get_top_items')
+    def test_get_top_seeds_cached_per_user(self, mock_top, app_ctx):
+        """Test seeds are reused for the same user and refetched for another"""
+        from backend.spotify_service import get_top_seeds
+        from flask import session
+
+        def top_items(kind, headers, limit, time_range):
+            user = headers['Authorization'].split()[-1]
+            return [{'id': f'{user}-{kind}-{i}'} for i in range(limit)]
+
+        mock_top.side_effect = top_items
+
+        session['user_id'] = 'seed_user_a'
+        first = get_top_seeds({'Authorization': 'Bearer a'})
+        second = get_top_seeds({'Authorization': 'Bearer a'})
+
+        assert first == second == (['a-artists-0', 'a-artists-1', 'a-artists-2'],
+                                   ['a-tracks-0', 'a-tracks-1'])
+        assert mock_top.call_count == 2
+
+        session['user_id'] = 'seed_user_b'
+        other = get_top_seeds({'Authorization': 'Bearer b'})
+
+        assert other == (['b-artists-0', 'b-artists-1', 'b-artists-2'],
+                         ['b-tracks-0', 'b-tracks-1'])
+        assert mock_top.call_count == 4
+
+        # Without a known user nothing is cached
+        del session['user_id']
+        get_top_seeds({'Authorization': 'Bearer c'})
+        get_top_seeds({'Authorization': 'Bearer c'})
+        assert mock_top.call_count == 8
+
+    @patch('backend.spotify_service.spotify_post')
+    def test_add_tracks_to_playlist_chunks(self, mock_post, app_ctx):
+        """Test long track lists are added in ordered chunks of 100"""
+        from backend.spotify_service import add_tracks_to_playlist
+        from flask import session
+
+        session['access_token'] = 'test_token'
+        session['refresh_token'] = 'test_refresh_token'
+
+        mock_response = Mock()
+        mock_response.status_code = 201
+        mock_response.content = b'{"snapshot_id": "abc"}'
+        mock_post.return_value = mock_response
+
+        uris = [f'spotify:track:{i}' for i in range(250)]
+        result = add_tracks_to_playlist('playlist123', uris)
+
+        assert result == {'snapshot_id': 'abc'}
+        assert mock_post.call_count == 3
+        sent = [c.kwargs['json']['uris'] for c in mock_post.call_args_list]
+        assert sent == [uris[0:100], uris[100:200], uris[200:250]]
+        for c in mock_post.call_args_list:
+            assert c.args[0].endswith('/playlists/playlist123/tracks')
+            assert c.kwargs['headers']['Content-Type'] == 'application/json'
+
     def test_get_recommendations_empty_response(self):
         """Test handling empty recommendations"""
         # Edge case: empty response
@@ -240,14 +528,13 @@ class TestSpotifyService:
 
 
 # Test Flask API Endpoints
+@app_state
 class TestAPIEndpoints:
     """Test Flask API routes"""
     
     @pytest.fixture
-    def client(self):
+    def client(self, app):
         """Create test client"""
-        from backend.app import app
-        app.config['TESTING'] = True
         with app.test_client() as client:
             yield client
     
@@ -306,16 +593,45 @@ class TestAPIEndpoints:
         data = json.loads(response.data)
         assert 'taste' in data  # Should handle gracefully
 
+    def test_auth_me_cached_per_session(self, app, client):
+        """Test /auth/me fetches the profile once per session, per token"""
+        profiles = {
+            'token_a': {'id': 'user_a', 'display_name': 'User A'},
+            'token_b': {'id': 'user_b', 'display_name': 'User B'},
+        }
+
+        with client.session_transaction() as sess:
+            sess['access_token'] = 'token_a'
+            sess['refresh_token'] = 'refresh_a'
+
+        with patch('spotify_auth.get_user_profile', side_effect=profiles.get) as mock_profile:
+            first = client.get('/auth/me')
+            second = client.get('/auth/me')
+
+            assert first.status_code == second.status_code == 200
+            assert json.loads(second.data)['user']['id'] == 'user_a'
+            mock_profile.assert_called_once_with('token_a')
+
+            # Another user's session does not see the first user's profile
+            with app.test_client() as other:
+                with other.session_transaction() as sess:
+                    sess['access_token'] = 'token_b'
+                    sess['refresh_token'] = 'refresh_b'
+                response = other.get('/auth/me')
+
+            assert json.loads(response.data)['user']['id'] == 'user_b'
+            assert mock_profile.call_count == 2
+            mock_profile.assert_called_with('token_b')
+
 
 # Test Production Hardening
+@app_state
 class TestProductionHardening:
     """Test production readiness features"""
 
     @pytest.fixture
-    def client(self):
+    def client(self, app):
         """Create test client"""
-        from backend.app import app
-        app.config['TESTING'] = True
         with app.test_client() as client:
             yield client
 
@@ -361,6 +677,174 @@ class TestProductionHardening:
         assert data['error'] == 'Resource not found'
 
 
+# Test Listening History Upload
+@app_state
+class TestUploadEndpoints:
+    """Test listening history upload routes"""
+
+    SAMPLE_DATA = os.path.join(os.path.dirname(__file__), '..', 'sample-data.json')
+
+    @pytest.fixture
+    def client(self, app):
+        """Create test client"""
+        with app.test_client() as client:
+            yield client
+
+    def test_upload_stream_raw_json(self, client):
+        """Test raw body upload creates a session"""
+        with open(self.SAMPLE_DATA, 'rb') as f:
+            response = client.post('/upload-stream', data=f.read(),
+                                   content_type='application/octet-stream')
+        data = json.loads(response.data)
+
+        assert response.status_code == 200
+        assert 'session_id' in data
+
+    def test_upload_stream_empty_body(self, client):
+        """Test raw body upload with no data"""
+        response = client.post('/upload-stream', data=b'',
+                               content_type='application/octet-stream')
+
+        assert response.status_code == 400
+
+    def test_upload_stream_invalid_file(self, client):
+        """Test raw body upload with unparseable data"""
+        response = client.post('/upload-stream', data=b'not a spotify export',
+                               content_type='application/octet-stream')
+        data = json.loads(response.data)
+
+        assert response.status_code == 400
+        assert 'Failed to parse file' in data['error']
+
+    def test_upload_multipart_zip(self, client):
+        """Test multipart upload of a ZIP export"""
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.write(self.SAMPLE_DATA, 'Spotify/Streaming_History_Audio_2023.json')
+        archive.seek(0)
+
+        response = client.post('/upload', data={'file': (archive, 'my_spotify_data.zip')},
+                               content_type='multipart/form-data')
+        data = json.loads(response.data)
+
+        assert response.status_code == 200
+        assert 'session_id' in data
+
+    def test_upload_unexpected_error_releases_session(self, client):
+        """Test a non-ParseError failure returns 500 and frees the session"""
+        from backend import app as app_module
+
+        with app_module.sessions_lock:
+            before = len(app_module.sessions)
+        with patch.object(app_module, 'parse_spotify_json_stream', side_effect=RuntimeError('boom')):
+            response = client.post('/upload-stream', data=b'[]',
+                                   content_type='application/octet-stream')
+
+        assert response.status_code == 500
+        with app_module.sessions_lock:
+            assert len(app_module.sessions) == before
+
+
+# Test In-Memory Session Store
+@app_state
+class TestSessionStore:
+    """Test session lifetime and recycling"""
+
+    SAMPLE_DATA = TestUploadEndpoints.SAMPLE_DATA
+
+    @pytest.fixture
+    def client(self, app):
+        """Create test client"""
+        with app.test_client() as client:
+            yield client
+
+    def upload(self, client):
+        with open(self.SAMPLE_DATA, 'rb') as f:
+            response = client.post('/upload-stream', data=f.read(),
+                                   content_type='application/octet-stream')
+        return json.loads(response.data)['session_id']
+
+    def test_touch_released_session(self, client):
+        """Test touching a session that was released in the meantime"""
+        from backend import app as app_module
+
+        session_id = self.upload(client)
+        session = app_module.get_session(session_id)
+        app_module.release_session(session_id)
+
+        assert app_module.touch_session(session_id, session) is False
+        assert app_module.get_session(session_id) is None
+
+    def test_recycled_session_is_reset(self, client):
+        """Test a session returned to the pool keeps no progress state"""
+        from backend import app as app_module
+
+        session_id = self.upload(client)
+        session = app_module.get_session(session_id)
+        app_module.set_progress(session, "complete", 100)
+        app_module.release_session(session_id)
+
+        _, error = session.ready()
+        assert error is not None
+        assert session.progress_stage == "uploading"
+        assert session.progress_frame == ("uploading", b"")
+        assert session.progress_message is None
+
+    def test_stale_lookup_is_not_served(self, client):
+        """Test a session that expires between lookup and touch returns 404"""
+        from backend import app as app_module
+
+        session_id = self.upload(client)
+        stale = app_module.get_session(session_id)
+        app_module.set_progress(stale, "complete", 100)
+        app_module.release_session(session_id)
+
+        with patch.object(app_module, 'get_session', return_value=stale):
+            summary = client.get(f'/session/{session_id}/summary')
+            process = client.post(f'/process/{session_id}')
+
+        assert summary.status_code == 404
+        assert process.status_code == 404
+
+    def test_era_detail_conditional_get(self, client):
+        """Test an era is revalidated with its ETag and served as 304"""
+        def fake_name_all_eras(eras, progress_callback=None, on_era_named=None):
+            for era in eras:
+                era.title = f'Era {era.id}'
+                era.summary = 'A test era'
+                if on_era_named:
+                    on_era_named(era)
+
+        # Four weeks of the same artist, enough listening time for one era
+        events = [
+            {
+                'ts': f'2024-01-{day:02d}T{hour:02d}:00:00Z',
+                'ms_played': 180000,
+                'master_metadata_track_name': f'Track {hour % 5}',
+                'master_metadata_album_artist_name': 'Artist',
+            }
+            for day in range(1, 29) for hour in range(10)
+        ]
+        response = client.post('/upload-stream', data=json.dumps(events),
+                               content_type='application/octet-stream')
+        session_id = json.loads(response.data)['session_id']
+
+        with patch('backend.app.name_all_eras', side_effect=fake_name_all_eras):
+            assert client.post(f'/process/{session_id}').status_code == 200
+
+        first = client.get(f'/session/{session_id}/eras/1')
+        assert first.status_code == 200
+        assert first.headers['ETag']
+        assert first.headers['Cache-Control'] == 'private, max-age=60'
+
+        second = client.get(f'/session/{session_id}/eras/1',
+                            headers={'If-None-Match': first.headers['ETag']})
+        assert second.status_code == 304
+        assert second.data == b''
+        assert second.headers['ETag'] == first.headers['ETag']
+        assert second.headers['Cache-Control'] == 'private, max-age=60'
+
+
 # Test Edge Cases
 class TestEdgeCases:
     """Test edge cases and boundary conditions"""
@@ -400,9 +884,73 @@ class TestEdgeCases:
         pass
     
     def test_rate_limit_exceeded(self):
-        """Test handling Spotify rate limits"""
-        # Should respect rate limits
-        pass
+        """Test a 429 is retried after its Retry-After delay"""
+        from backend import spotify_auth
+
+        limited = Mock(status_code=429, headers={'Retry-After': '2'})
+        ok = Mock(status_code=200)
+        with patch.object(spotify_auth.spotify_http, 'get', side_effect=[limited, ok]) as mock_get, \
+                patch.object(spotify_auth.time, 'sleep') as mock_sleep:
+            response = spotify_auth.spotify_get('https://api.spotify.com/v1/me')
+
+        assert response is ok
+        assert mock_get.call_count == 2
+        mock_sleep.assert_called_once_with(2)
+
+    def test_rate_limit_long_retry_after(self):
+        """Test a Retry-After above the cap is returned without waiting"""
+        from backend import spotify_auth
+
+        limited = Mock(status_code=429, headers={'Retry-After': str(spotify_auth.SPOTIFY_MAX_RETRY_AFTER + 1)})
+        with patch.object(spotify_auth.spotify_http, 'post', return_value=limited) as mock_post, \
+                patch.object(spotify_auth.time, 'sleep') as mock_sleep:
+            response = spotify_auth.spotify_post('https://api.spotify.com/v1/users/u/playlists')
+
+        assert response.status_code == 429
+        assert mock_post.call_count == 1
+        mock_sleep.assert_not_called()
+
+    def test_rate_limit_retries_exhausted(self):
+        """Test repeated 429s stop after SPOTIFY_429_RETRIES retries"""
+        from backend import spotify_auth
+
+        limited = Mock(status_code=429, headers={})
+        with patch.object(spotify_auth.spotify_http, 'get', return_value=limited) as mock_get, \
+                patch.object(spotify_auth.time, 'sleep') as mock_sleep:
+            response = spotify_auth.spotify_get('https://api.spotify.com/v1/me')
+
+        assert response.status_code == 429
+        assert mock_get.call_count == spotify_auth.SPOTIFY_429_RETRIES + 1
+        # No Retry-After header means a 1 second wait between attempts
+        assert [c.args for c in mock_sleep.call_args_list] == [(1,)] * spotify_auth.SPOTIFY_429_RETRIES
+
+    def test_rate_limiter_window(self):
+        """Test the limiter admits max_calls per period, then waits for the oldest"""
+        from backend import spotify_auth
+
+        now = [100.0]
+        limiter = spotify_auth.RateLimiter(max_calls=2, period=10)
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        with patch.object(spotify_auth.time, 'monotonic', side_effect=lambda: now[0]), \
+                patch.object(spotify_auth.time, 'sleep', side_effect=sleep) as mock_sleep:
+            limiter.acquire()
+            now[0] += 3
+            limiter.acquire()
+            mock_sleep.assert_not_called()
+
+            # Third call in the window waits until the first one ages out
+            limiter.acquire()
+            mock_sleep.assert_called_once_with(7.0)
+            assert now[0] == 110.0
+
+            # Once the window has passed, calls are admitted immediately again
+            now[0] += 20
+            limiter.acquire()
+            limiter.acquire()
+            assert mock_sleep.call_count == 1
     
     def test_unicode_song_names(self):
         """Test handling non-ASCII characters"""
@@ -440,5 +988,245 @@ class TestDataPersistence:
         pass
 
 
+# Test Listening History Parser
+class TestParser:
+    """Test parsing of Spotify streaming history JSON"""
+
+    @pytest.mark.parametrize('content, message', [
+        (b'', 'Expected JSON array'),
+        (b' \t\r\n', 'Expected JSON array'),
+        (b'<!DOCTYPE html><html><body>Error</body></html>', 'Expected JSON array'),
+        (b'{}', 'Expected JSON array'),
+        (b'"[]"', 'Expected JSON array'),
+        (b'[{"ts": "2024-01-01T00:00:00Z"}', 'array is not terminated'),
+        (b'[1, 2,]', 'Invalid JSON'),
+        (b'[{"ts": }]', 'Invalid JSON'),
+    ])
+    def test_rejects_non_arrays(self, content, message):
+        """Test inputs that are not a JSON array raise ParseError"""
+        from backend.parser import parse_spotify_json, ParseError
+
+        with pytest.raises(ParseError, match=message):
+            parse_spotify_json(content)
+
+    def test_accepts_whitespace_padded_array(self):
+        """Test surrounding JSON whitespace is allowed"""
+        from backend.parser import parse_spotify_json
+
+        entry = {
+            'ts': '2024-01-01T12:00:00Z',
+            'ms_played': 60000,
+            'master_metadata_track_name': 'Track',
+            'master_metadata_album_artist_name': 'Artist',
+        }
+        history = parse_spotify_json(b'\r\n\t ' + json.dumps([entry]).encode() + b' \n')
+
+        assert len(history) == 1
+        assert history.artists == ['Artist']
+
+    def test_skips_malformed_entries(self):
+        """Test bad entries are skipped rather than failing the whole file"""
+        from backend.parser import parse_spotify_json
+
+        good = {
+            'ts': '2024-01-01T12:00:00Z',
+            'ms_played': 60000,
+            'master_metadata_track_name': 'Track',
+            'master_metadata_album_artist_name': 'Artist',
+        }
+        entries = [
+            good,
+            None,
+            'not an object',
+            {**good, 'ms_played': 1000},  # too short
+            {key: value for key, value in good.items() if key != 'ts'},
+            {**good, 'master_metadata_track_name': None},  # podcast
+            {**good, 'ts': 'yesterday'},
+            {**good, 'ts': None},
+        ]
+        history = parse_spotify_json(json.dumps(entries).encode())
+
+        assert len(history) == 1
+        assert history.tracks == ['Track']
+
+    def test_deduplicates_exact_repeats_only(self):
+        """Test rows collapse on identical (ts, track, artist), as before"""
+        from backend.parser import parse_spotify_json
+
+        def play(ts, track='Track', artist='Artist', ms=60000):
+            return {
+                'ts': ts,
+                'ms_played': ms,
+                'master_metadata_track_name': track,
+                'master_metadata_album_artist_name': artist,
+            }
+
+        entries = [
+            play('2024-01-01T12:00:00Z'),
+            play('2024-01-01T12:00:00Z'),                   # exact repeat
+            play('2024-01-01T12:00:00Z', ms=90000),         # repeat, other ms_played
+            play('2024-01-01T12:00:00Z', track='Other'),    # same time, other track
+            play('2024-01-01T12:00:00Z', artist='Other'),   # same time, other artist
+            play('2024-01-01T12:05:00Z'),                   # same track, later
+            play('2024-01-01T12:05:00.500Z'),               # same second, other ts
+            play('2024-01-01T12:05:00+00:00'),              # same instant, other ts
+        ]
+        history = parse_spotify_json(json.dumps(entries).encode())
+
+        rows = [
+            (int(ts), history.tracks[track], history.artists[artist], int(ms))
+            for ts, track, artist, ms in zip(
+                history.timestamps, history.track_ids, history.artist_ids, history.ms_played
+            )
+        ]
+        noon = int(datetime.fromisoformat('2024-01-01T12:00:00+00:00').timestamp())
+        assert rows == [
+            (noon, 'Track', 'Artist', 60000),
+            (noon, 'Other', 'Artist', 60000),
+            (noon, 'Track', 'Other', 60000),
+            (noon + 300, 'Track', 'Artist', 60000),
+            (noon + 300, 'Track', 'Artist', 60000),
+            (noon + 300, 'Track', 'Artist', 60000),
+        ]
+
+
+# Test Era Segmentation
+def reference_segmentation(history, threshold):
+    """
+    The original dict/Counter segmentation, kept as an oracle for the
+    vectorized one: returns (boundaries, eras as tuples)
+    """
+    from collections import Counter
+    from datetime import timedelta, timezone
+
+    weeks = {}
+    rows = zip(history.timestamps.tolist(), history.ms_played.tolist(),
+               history.artist_ids.tolist(), history.track_ids.tolist())
+    for ts, ms, artist_id, track_id in rows:
+        day = datetime.fromtimestamp(ts, tz=timezone.utc).date()
+        week = weeks.setdefault(day - timedelta(days=day.weekday()),
+                                {'artists': Counter(), 'tracks': Counter(), 'total_ms': 0})
+        artist = history.artists[artist_id]
+        week['artists'][artist] += 1
+        week['tracks'][(history.tracks[track_id], artist)] += 1
+        week['total_ms'] += ms
+
+    starts = sorted(weeks)
+    boundaries = []
+    for i, start in enumerate(starts):
+        if i == 0 or (start - starts[i - 1]).days > 28:
+            boundaries.append(i)
+            continue
+        prev, cur = weeks[starts[i - 1]]['artists'], weeks[start]['artists']
+        n = min(20, len(prev), len(cur))
+        top_prev = {artist for artist, _ in prev.most_common(n)}
+        top_cur = {artist for artist, _ in cur.most_common(n)}
+        if len(top_prev & top_cur) / len(top_prev | top_cur) < threshold:
+            boundaries.append(i)
+
+    eras = []
+    for i, lo in enumerate(boundaries):
+        hi = boundaries[i + 1] if i + 1 < len(boundaries) else len(starts)
+        artists, tracks, total_ms = Counter(), Counter(), 0
+        for start in starts[lo:hi]:
+            artists.update(weeks[start]['artists'])
+            tracks.update(weeks[start]['tracks'])
+            total_ms += weeks[start]['total_ms']
+        eras.append((
+            i + 1, starts[lo], starts[hi - 1] + timedelta(days=6),
+            artists.most_common(10),
+            [(track, artist, count) for (track, artist), count in tracks.most_common(20)],
+            total_ms
+        ))
+
+    return boundaries, eras
+
+
+def make_history(seed):
+    """
+    Deterministic history with empty weeks, a >4 week gap, drifting taste and
+    many equal play counts (so top-N cut-offs fall inside ties)
+    """
+    import random
+    import numpy as np
+    from backend.models import ListeningHistory
+
+    rng = random.Random(seed)
+    week = 7 * 86400
+    monday = 1672617600  # 2023-01-02 00:00 UTC
+    active_weeks = [w for w in range(40) if w % 5 != 3] + list(range(48, 56))
+
+    timestamps, ms_played, artist_ids, track_ids = [], [], [], []
+    for w in active_weeks:
+        # The favoured artists shift every few weeks; 30 of them per week
+        # with one or two plays each makes ties around the top 20
+        base = (w // 6) * 7
+        pool = [base + k for k in range(30)]
+        for artist in pool:
+            for _ in range(rng.choice([1, 1, 2])):
+                timestamps.append(monday + w * week + rng.randrange(week))
+                ms_played.append(rng.randint(30000, 300000))
+                artist_ids.append(artist)
+                track_ids.append(artist * 3 + rng.randrange(3))
+
+    order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+    n_artists = max(artist_ids) + 1
+    return ListeningHistory(
+        timestamps=np.array([timestamps[i] for i in order], dtype=np.int64),
+        ms_played=np.array([ms_played[i] for i in order], dtype=np.int64),
+        artist_ids=np.array([artist_ids[i] for i in order], dtype=np.int32),
+        track_ids=np.array([track_ids[i] for i in order], dtype=np.int32),
+        artists=[f'Artist {i}' for i in range(n_artists)],
+        tracks=[f'Track {i}' for i in range(n_artists * 3)],
+    )
+
+
+class TestSegmentation:
+    """Test the vectorized segmentation against the original algorithm"""
+
+    @pytest.mark.parametrize('seed', range(5))
+    @pytest.mark.parametrize('threshold', [0.1, 0.3, 0.6])
+    def test_matches_reference(self, seed, threshold):
+        """Test boundaries and eras match the dict-based implementation"""
+        from backend.segmentation import aggregate_by_week, build_eras, detect_era_boundaries
+
+        history = make_history(seed)
+        expected_boundaries, expected_eras = reference_segmentation(history, threshold)
+
+        weeks = aggregate_by_week(history)
+        boundaries = detect_era_boundaries(weeks, threshold)
+        eras = build_eras(weeks, boundaries, history)
+
+        assert boundaries == expected_boundaries
+        assert [
+            (e.id, e.start_date, e.end_date, e.top_artists, e.top_tracks, e.total_ms_played)
+            for e in eras
+        ] == expected_eras
+
+    def test_reference_history_has_gaps_and_ties(self):
+        """Test the fixture exercises empty weeks, long gaps and tied counts"""
+        from backend.segmentation import aggregate_by_week
+
+        weeks = aggregate_by_week(make_history(0))
+        gaps = {(b - a).days for a, b in zip(weeks.week_starts, weeks.week_starts[1:])}
+        assert 14 in gaps  # an empty week between two active ones
+        assert max(gaps) > 28  # a gap that always starts a new era
+        assert len(weeks.artist_counts) > len(set(weeks.artist_counts.tolist()))
+
+    def test_empty_history(self):
+        """Test an empty history produces no weeks and no boundaries"""
+        import numpy as np
+        from backend.models import ListeningHistory
+        from backend.segmentation import aggregate_by_week, detect_era_boundaries
+
+        empty = np.array([], dtype=np.int64)
+        history = ListeningHistory(empty, empty, empty.astype(np.int32),
+                                   empty.astype(np.int32), [], [])
+        weeks = aggregate_by_week(history)
+
+        assert len(weeks) == 0
+        assert detect_era_boundaries(weeks) == []
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])